@@ -0,0 +1,74 @@
+import argparse
+import json
+import os
+
+import pygame
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+IMAGE_DIR = os.path.join(ROOT, 'images')
+ATLAS_DIR = os.path.join(IMAGE_DIR, 'atlas')
+PADDING = 1
+SHEETS = {
+    'player': ['player/base', 'player/idle', 'player/idlef', 'player/walk', 'player/walkf',
+               'player/jump', 'player/jumpf', 'player/dash', 'player/dashf'],
+    'coin': ['coin'],
+    'bee': ['obstacles/bee_a', 'obstacles/bee_b', 'obstacles/bee_rest'],
+}
+
+def sheet_rows(entries):
+    rows, singles = [], []
+    for entry in entries:
+        folder = os.path.join(IMAGE_DIR, entry)
+        if os.path.isdir(folder):
+            names = [os.path.splitext(name)[0] for name in os.listdir(folder) if name.endswith('.png')]
+            names.sort(key=lambda name: (not name.isdigit(), int(name) if name.isdigit() else 0, name))
+            rows.append([f'{entry}/{name}' for name in names])
+        else:
+            singles.append(entry)
+    if singles:
+        rows.append(singles)
+    return rows
+
+def pack_sheet(entries):
+    rows = sheet_rows(entries)
+    frames = {}
+    images = {}
+    width = height = 0
+    for row in rows:
+        x = 0
+        row_height = 0
+        for name in row:
+            image = pygame.image.load(os.path.join(IMAGE_DIR, name + '.png'))
+            images[name] = image
+            frame_width, frame_height = image.get_size()
+            frames[name] = [x, height, frame_width, frame_height]
+            x += frame_width + PADDING
+            row_height = max(row_height, frame_height)
+        width = max(width, x)
+        height += row_height + PADDING
+    sheet = pygame.Surface((max(width, 1), max(height, 1)), pygame.SRCALPHA)
+    sheet.fill((0, 0, 0, 0))
+    for name, (x, y, _, _) in frames.items():
+        sheet.blit(images[name], (x, y), special_flags=pygame.BLEND_RGBA_MAX)
+    return sheet, frames
+
+def build(atlas_dir=ATLAS_DIR):
+    os.makedirs(atlas_dir, exist_ok=True)
+    index = {'version': 1, 'sheets': {}}
+    for sheet_name, entries in SHEETS.items():
+        sheet, frames = pack_sheet(entries)
+        file_name = sheet_name + '.png'
+        pygame.image.save(sheet, os.path.join(atlas_dir, file_name))
+        index['sheets'][sheet_name] = {'image': file_name, 'frames': frames}
+        print(f'{sheet_name}: {len(frames)} frames packed into {sheet.get_width()}x{sheet.get_height()}')
+    with open(os.path.join(atlas_dir, 'atlas.json'), 'w') as index_file:
+        json.dump(index, index_file)
+
+def main():
+    parser = argparse.ArgumentParser(description='Pack the player, coin and bee animation frames into sprite-sheet atlases.')
+    parser.add_argument('--output-dir', default=ATLAS_DIR)
+    args = parser.parse_args()
+    build(args.output_dir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+import argparse
+import sys
+import time
+
+import numpy as np
+
+import headless
+
+STATE = ('left', 'top', 'dx', 'dy', 'on_ground', 'can_dash', 'flip', 'n_dash', 'time_dash')
+
+def physics_constants(player):
+    return {
+        'size': (player.width, player.height),
+        'anchor': player._anchor,
+        'speed': player.speed,
+        'jump_speed': player.jump_speed,
+        'gravity': player.gravity,
+        'max_fall_speed': player.max_fall_speed,
+        'dash_speed': player.dash_speed,
+        'dash_ticks': player.dash_ticks,
+        'n_dash': player.n_dash,
+    }
+
+class PlayerBatch:
+    # Player.update for many players at once: one array per attribute, the rect kept as left/top like the
+    # Actor's ZRect, and the solids walked in collision-list order so the sequential pushes come out the same
+    def __init__(self, count, solids, start, world_size, physics, tile_size=64, margin=32):
+        self.count = count
+        self.physics = physics
+        self.width, self.height = physics['size']
+        self.anchor_x, self.anchor_y = physics['anchor']
+        self.start = start
+        self.world_width, self.world_height = world_size
+        self.tile_size = tile_size
+        self.margin = margin
+        self.solid_x = np.array([solid.x for solid in solids], dtype=np.float64)
+        self.solid_y = np.array([solid.y for solid in solids], dtype=np.float64)
+        self.solid_w = np.array([solid.w for solid in solids], dtype=np.float64)
+        self.solid_h = np.array([solid.h for solid in solids], dtype=np.float64)
+        # the cells each solid was filed under in SpatialGrid, so the broad phase filters the same way
+        self.solid_cells = np.array([(int(solid.left // tile_size), int(solid.top // tile_size),
+                                      int(solid.right // tile_size), int(solid.bottom // tile_size)) for solid in solids],
+                                    dtype=np.int64).reshape(-1, 4)
+        self.left = np.full(count, start[0] - self.anchor_x, dtype=np.float64)
+        self.top = np.full(count, start[1] - self.anchor_y, dtype=np.float64)
+        self.dx = np.zeros(count, dtype=np.float64)
+        self.dy = np.zeros(count, dtype=np.float64)
+        self.on_ground = np.zeros(count, dtype=bool)
+        self.can_dash = np.zeros(count, dtype=bool)
+        self.flip = np.zeros(count, dtype=bool)
+        self.n_dash = np.full(count, physics['n_dash'], dtype=np.int64)
+        self.time_dash = np.zeros(count, dtype=np.int64)
+
+    @classmethod
+    def for_level(cls, count, rows, player_params=None):
+        main = headless.boot()
+        player = main.Player('player/idle/0', (100, 0), [], [])
+        for name, value in (player_params or {}).items(): setattr(player, name, value)
+        start = main.find_start(rows) or (player.x, player.y)
+        return cls(count, main.merge_solid_tiles(rows), start, main.level_size(rows), physics_constants(player),
+                   main.TILE_SIZE, main.COLLISION_MARGIN)
+
+    @property
+    def x(self):
+        return self.left + self.anchor_x
+
+    @property
+    def y(self):
+        return self.top + self.anchor_y
+
+    def candidates(self):
+        # SpatialGrid.query: cells under the rect grown by the margin, then every solid filed in one of them
+        size, margin = self.tile_size, self.margin
+        cells = (np.floor_divide(self.left - margin, size), np.floor_divide(self.top - margin, size),
+                 np.floor_divide(self.left + self.width + margin, size), np.floor_divide(self.top + self.height + margin, size))
+        # solids no player can reach this pass are skipped before the per-solid loop
+        reach = ((self.solid_cells[:, 0] <= cells[2].max()) & (self.solid_cells[:, 2] >= cells[0].min()) &
+                 (self.solid_cells[:, 1] <= cells[3].max()) & (self.solid_cells[:, 3] >= cells[1].min()))
+        for index in np.flatnonzero(reach).tolist():
+            cell_left, cell_top, cell_right, cell_bottom = self.solid_cells[index]
+            near = (cell_left <= cells[2]) & (cell_right >= cells[0]) & (cell_top <= cells[3]) & (cell_bottom >= cells[1])
+            yield index, near
+
+    def hits(self, index, near):
+        solid_x, solid_y = self.solid_x[index], self.solid_y[index]
+        return (near & (self.left < solid_x + self.solid_w[index]) & (self.top < solid_y + self.solid_h[index]) &
+                (self.left + self.width > solid_x) & (self.top + self.height > solid_y))
+
+    def x_collision_check(self):
+        for index, near in self.candidates():
+            hit = self.hits(index, near)
+            if not hit.any(): continue
+            self.left = np.where(hit & (self.dx > 0), self.solid_x[index] - self.width, self.left)
+            self.left = np.where(hit & (self.dx < 0), self.solid_x[index] + self.solid_w[index], self.left)
+
+    def y_collision_check(self):
+        for index, near in self.candidates():
+            hit = self.hits(index, near)
+            if not hit.any(): continue
+            down, up = hit & (self.dy > 0), hit & (self.dy < 0)
+            self.top = np.where(down, self.solid_y[index] - self.height, self.top)
+            self.top = np.where(up, self.solid_y[index] + self.solid_h[index], self.top)
+            self.on_ground |= down
+            self.dy[down | up] = 0
+
+    def events(self, buttons):
+        main = headless.boot()
+        free = ~self.can_dash
+        left = free & ((buttons & main.LEFT) != 0)
+        right = free & ~left & ((buttons & main.RIGHT) != 0)
+        self.dx = np.where(free, np.where(left, -1, np.where(right, 1, 0)), self.dx)
+        self.flip = np.where(left, True, np.where(right, False, self.flip))
+        jump = free & ((buttons & main.JUMP) != 0) & self.on_ground
+        self.on_ground &= ~jump
+        self.dy[jump] = self.physics['jump_speed']
+        dash = free & ((buttons & main.DASH) != 0) & ~self.on_ground & (self.n_dash > 0)
+        self.can_dash |= dash
+        self.n_dash -= dash
+        dash_speed = self.physics['dash_speed']
+        self.dx = np.where(dash, np.where(self.flip, -dash_speed, dash_speed), self.dx)
+        self.dy[dash] = 0
+
+    def move(self):
+        dash_step = self.physics['dash_speed'] * 5
+        x = np.where(self.can_dash, self.x + np.where(self.flip, -dash_step, dash_step), self.x + self.dx * self.physics['speed'])
+        self.left = x - self.anchor_x
+
+    def gravity_force(self):
+        falling = ~self.can_dash
+        speeding = falling & (self.dy < self.physics['max_fall_speed'])
+        self.dy = np.where(speeding, self.dy + self.physics['gravity'], self.dy)
+        self.top = np.where(falling, (self.y + self.dy) - self.anchor_y, self.top)
+
+    def reset_dash(self, dash_move_speed):
+        self.time_dash += self.can_dash
+        done = self.can_dash & (self.time_dash >= dash_move_speed)
+        self.can_dash &= ~done
+        self.time_dash[done] = 0
+        self.dx[done] = 0
+
+    def drop_platform(self):
+        fallen = self.y > self.world_height + 200
+        self.left[fallen] = self.start[0] - self.anchor_x
+        self.top[fallen] = self.start[1] - self.anchor_y
+
+    def limit_to_screen(self):
+        self.left = np.maximum(64, np.minimum(self.x, self.world_width - 64)) - self.anchor_x
+
+    def update(self, buttons):
+        buttons = np.broadcast_to(np.asarray(buttons, dtype=np.int64), (self.count,))
+        self.events(buttons)
+        self.move()
+        self.x_collision_check()
+        self.gravity_force()
+        self.y_collision_check()
+        self.reset_dash(self.physics['dash_ticks'])
+        self.drop_platform()
+        self.limit_to_screen()
+
+def scalar_state(player):
+    return (player.left, player.top, player.direction.x, player.direction.y, player.on_ground, player.can_dash,
+            player.flip, player.n_dash, player.time_dash)
+
+def verify(rows, players=64, frames=600, seed=0, player_params=None):
+    # steps real Player objects and a PlayerBatch side by side on the same solids and inputs;
+    # returns None when every field matched on every frame, else the first difference
+    import bench
+    main = headless.boot()
+    batch = PlayerBatch.for_level(players, rows, player_params)
+    solids = main.merge_solid_tiles(rows)
+    grid = main.SpatialGrid(solids)
+    world_width, world_height = main.level_size(rows)
+    scalars = []
+    for _ in range(players):
+        player = main.Player('player/idle/0', (100, 0), solids, [])
+        for name, value in (player_params or {}).items(): setattr(player, name, value)
+        player.collision_grid = grid
+        player.world_width, player.world_height = world_width, world_height
+        player.x, player.y = player.start_position = batch.start
+        player.controls = main.ButtonState()
+        scalars.append(player)
+    policies = [bench.random_policy(seed + index) for index in range(players)]
+    for frame in range(frames):
+        buttons = np.array([next(policy) for policy in policies])
+        for player, pressed in zip(scalars, buttons.tolist()):
+            player.controls.set(pressed)
+            player.update()
+        batch.update(buttons)
+        columns = [getattr(batch, name) for name in STATE]
+        for index, player in enumerate(scalars):
+            for name, expected, column in zip(STATE, scalar_state(player), columns):
+                if expected != column[index]:
+                    return {'frame': frame, 'player': index, 'field': name, 'scalar': expected, 'batch': column[index].item()}
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Step many players at once with the vectorized batch physics.')
+    parser.add_argument('--stage', type=int, default=0)
+    parser.add_argument('--players', type=int, default=4096)
+    parser.add_argument('--frames', type=int, default=600)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--verify', type=int, default=64, metavar='N',
+                        help='also check N players frame by frame against Player.update (0 skips)')
+    args = parser.parse_args()
+
+    main_module = headless.boot()
+    rows = list(main_module.WORLD_MAP[args.stage])
+    if args.verify:
+        start = time.perf_counter()
+        mismatch = verify(rows, args.verify, args.frames, args.seed)
+        elapsed = time.perf_counter() - start
+        if mismatch is not None:
+            print(f'batch differs from Player.update: {mismatch}')
+            sys.exit(1)
+        print(f'{args.verify} players x {args.frames} frames match Player.update exactly ({elapsed:.2f}s for both)')
+
+    import bench
+    batch = PlayerBatch.for_level(args.players, rows)
+    policies = [bench.random_policy(args.seed + index) for index in range(args.players)]
+    inputs = np.array([[next(policy) for policy in policies] for _ in range(args.frames)])
+    start = time.perf_counter()
+    for buttons in inputs:
+        batch.update(buttons)
+    elapsed = time.perf_counter() - start
+    steps = args.players * args.frames
+    print(f'{args.players} players x {args.frames} frames in {elapsed:.3f}s '
+          f'({steps / max(elapsed, 1e-9):,.0f} player-steps/s, {elapsed / args.frames * 1000:.2f} ms per frame)')
+
+if __name__ == '__main__':
+    main()
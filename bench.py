@@ -0,0 +1,237 @@
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import headless
+
+DEFAULT_SIZES = ['20x12', '200x40', '2000x200']
+DENSITIES = {
+    'sparse': {'platform_density': 0.05, 'bee_density': 0.002, 'coin_density': 0.01},
+    'dense': {'platform_density': 0.25, 'bee_density': 0.02, 'coin_density': 0.08},
+}
+
+def generate_level(width, height, platform_density=0.1, bee_density=0.01, coin_density=0.05, seed=0):
+    rng = random.Random(seed)
+    rows = [[' '] * width for _ in range(height)]
+    ground_top = max(height - 3, 1)
+    for row in range(ground_top, height):
+        for col in range(width):
+            rows[row][col] = 'X'
+    for row in range(2, ground_top - 1, 3):
+        col = 0
+        while col < width - 2:
+            if rng.random() < platform_density:
+                length = rng.randint(3, 8)
+                end = min(col + length, width)
+                rows[row][col] = 'L'
+                for inner in range(col + 1, end - 1):
+                    rows[row][inner] = 'G'
+                rows[row][end - 1] = 'R'
+                col = end + 1
+            else:
+                col += 1
+    for row in range(ground_top):
+        for col in range(2, width):
+            if rows[row][col] != ' ':
+                continue
+            roll = rng.random()
+            if roll < bee_density:
+                rows[row][col] = 'O'
+            elif roll < bee_density + coin_density:
+                rows[row][col] = 'A'
+    rows[ground_top - 1][1] = 'P'
+    return [''.join(row) for row in rows]
+
+def summarize(samples):
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    def percentile(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+    return {
+        'mean_ms': sum(ordered) / len(ordered) * 1000,
+        'p50_ms': percentile(0.50) * 1000,
+        'p95_ms': percentile(0.95) * 1000,
+        'p99_ms': percentile(0.99) * 1000,
+        'max_ms': ordered[-1] * 1000,
+        'samples': len(ordered),
+    }
+
+def random_policy(seed, hold=8):
+    main = headless.boot()
+    rng = random.Random(seed)
+    buttons = 0
+    frame = 0
+    while True:
+        if frame % hold == 0:
+            buttons = 0
+            roll = rng.random()
+            if roll < 0.6: buttons |= main.RIGHT
+            elif roll < 0.85: buttons |= main.LEFT
+            if rng.random() < 0.3: buttons |= main.JUMP
+            if rng.random() < 0.05: buttons |= main.DASH
+        yield buttons
+        frame += 1
+
+def run_frames(scene, controls, policy, frames, draw_screen=None):
+    update_times, draw_times = [], []
+    for _ in range(frames):
+        controls.set(next(policy))
+        start = time.perf_counter()
+        scene.update()
+        update_times.append(time.perf_counter() - start)
+        if draw_screen is not None:
+            start = time.perf_counter()
+            scene.draw(draw_screen)
+            draw_times.append(time.perf_counter() - start)
+        scene.new = scene
+    return update_times, draw_times
+
+def preload_step_times(main, level):
+    # the same steps StagePreloader.idle spreads over frames, each one timed on its own
+    scene = main.GameScene(main.World(), level, preload=True)
+    times = []
+    while scene.loading is not None:
+        start = time.perf_counter()
+        scene.load_step()
+        times.append(time.perf_counter() - start)
+    return times
+
+def build_scene(main, level, controls):
+    scene = main.GameScene(main.World(), level)
+    scene.player.controls = controls
+    scene.player.life = 10 ** 9
+    return scene
+
+def bench_case(main, screen, width, height, density_name, frames, map_repeats, seed, measure_memory):
+    level = generate_level(width, height, seed=seed, **DENSITIES[density_name])
+    controls = main.ButtonState()
+
+    start = time.perf_counter()
+    scene = build_scene(main, level, controls)
+    scene_build = time.perf_counter() - start
+
+    generate_times = []
+    for _ in range(map_repeats):
+        # a throwaway scene with its own stores each time, so the Bee/Coin proxies don't pile up in the one benchmarked below
+        map_scene = main.Scene(main.World())
+        map_scene.level = level
+        map_scene.bees, map_scene.coins = main.BeeStore(), main.CoinStore()
+        player = main.Player('player/idle/0', (0, 0), [], [])
+        start = time.perf_counter()
+        map_scene.generate_map([], [], player)
+        generate_times.append(time.perf_counter() - start)
+        del map_scene
+
+    preload_times = preload_step_times(main, level)
+
+    random.seed(seed)
+    update_times, draw_times = run_frames(scene, controls, random_policy(seed), frames, screen)
+
+    result = {
+        'map': {'width': width, 'height': height, 'density': density_name, 'seed': seed,
+                'tiles': width * height,
+                'sprites': len(scene.all_sprites), 'collisions': len(scene.all_collisions)},
+        'scene_build_ms': scene_build * 1000,
+        'generate_map': summarize(generate_times),
+        'preload_step': summarize(preload_times),
+        'update': summarize(update_times),
+        'draw': summarize(draw_times),
+        'frame': summarize([u + d for u, d in zip(update_times, draw_times)]),
+    }
+    del scene
+
+    if measure_memory:
+        tracemalloc.start()
+        scene = build_scene(main, level, controls)
+        run_frames(scene, controls, random_policy(seed), min(frames, 60), screen)
+        result['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        del scene
+    return result
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def case_key(result):
+    map_info = result['map']
+    return f"{map_info['width']}x{map_info['height']}-{map_info['density']}"
+
+def compare(baseline_path, results, threshold):
+    with open(baseline_path) as baseline_file:
+        baseline = {case_key(result): result for result in json.load(baseline_file)['results']}
+    regressions = 0
+    for result in results:
+        old = baseline.get(case_key(result))
+        if old is None:
+            continue
+        for section in ('update', 'draw', 'frame'):
+            for metric in ('mean_ms', 'p95_ms', 'p99_ms'):
+                before, after = old[section].get(metric), result[section].get(metric)
+                if not before or after is None:
+                    continue
+                change = (after - before) / before
+                flag = ''
+                if change > threshold:
+                    flag = '  REGRESSION'
+                    regressions += 1
+                print(f'{case_key(result):>20} {section:>7} {metric:>8}: {before:8.3f} -> {after:8.3f} ms ({change:+.1%}){flag}')
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark map generation and per-frame update/draw on synthetic maps.')
+    parser.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES, help='map sizes in tiles, e.g. 20x12 2000x200')
+    parser.add_argument('--densities', nargs='+', default=list(DENSITIES), choices=list(DENSITIES))
+    parser.add_argument('--frames', type=int, default=600)
+    parser.add_argument('--map-repeats', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc pass')
+    parser.add_argument('--output', default='bench_output.json')
+    parser.add_argument('--compare', help='previous JSON output to compare against')
+    parser.add_argument('--threshold', type=float, default=0.15, help='relative slowdown reported as a regression')
+    args = parser.parse_args()
+
+    main_module = headless.boot()
+    screen = headless.offscreen()
+    results = []
+    over_budget = 0
+    for size in args.sizes:
+        width, height = (int(value) for value in size.lower().split('x'))
+        for density_name in args.densities:
+            result = bench_case(main_module, screen, width, height, density_name, args.frames,
+                                args.map_repeats, args.seed, not args.no_memory)
+            results.append(result)
+            print(f"{case_key(result):>20}: build {result['scene_build_ms']:9.1f} ms | "
+                  f"generate_map {result['generate_map']['mean_ms']:9.1f} ms | "
+                  f"update {result['update']['mean_ms']:7.3f}/{result['update']['p99_ms']:7.3f} ms | "
+                  f"draw {result['draw']['mean_ms']:7.3f}/{result['draw']['p99_ms']:7.3f} ms (mean/p99) | "
+                  f"preload step max {result['preload_step']['max_ms']:6.2f} ms")
+            if result['preload_step']['max_ms'] > main_module.PRELOAD_BUDGET * 1000:
+                print(f"{case_key(result):>20}: a preload step went over the {main_module.PRELOAD_BUDGET * 1000:.0f} ms budget")
+                over_budget += 1
+
+    report = {
+        'meta': {'revision': git_revision(), 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                 'python': platform.python_version(), 'platform': platform.platform(),
+                 'frames': args.frames, 'seed': args.seed},
+        'results': results,
+    }
+    with open(args.output, 'w') as output:
+        json.dump(report, output, indent=2)
+    print(f'wrote {args.output}')
+
+    if args.compare and compare(args.compare, results, args.threshold):
+        sys.exit(1)
+    if over_budget:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
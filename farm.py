@@ -0,0 +1,157 @@
+import argparse
+import csv
+import inspect
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import headless
+
+PLAYER_SETTINGS = {'life', 'speed', 'jump_speed', 'gravity', 'max_fall_speed', 'dash_speed', 'dash_ticks', 'n_dash'}
+BEE_ALIASES = {'limit': 'patrol'} # the old Bee attribute name for the patrol distance
+FIELDS = ['episode', 'stage', 'seed', 'policy', 'params', 'bees', 'result', 'frames', 'frames_to_exit',
+          'stages_cleared', 'deaths', 'coins', 'seconds']
+
+def parse_value(text):
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    return text
+
+def parse_grid(specs):
+    # ["speed=4,5", "jump_speed=-14"] -> [{'speed': 4, 'jump_speed': -14}, {'speed': 5, 'jump_speed': -14}]
+    axes = []
+    for spec in specs:
+        name, _, values = spec.partition('=')
+        if not values:
+            raise ValueError(f'expected name=value[,value...], got {spec!r}')
+        axes.append([(name, parse_value(value)) for value in values.split(',')])
+    return [dict(combo) for combo in itertools.product(*axes)]
+
+def bee_settings():
+    main = headless.boot()
+    return set(inspect.signature(main.BeeStore.__init__).parameters) - {'self', 'capacity'}
+
+def check_grid(grid, allowed, aliases=None):
+    # unknown names would otherwise be set on nothing (player) or crash inside a worker (bees)
+    aliases = aliases or {}
+    checked = []
+    for params in grid:
+        params = {aliases.get(name, name): value for name, value in params.items()}
+        unknown = sorted(set(params) - allowed)
+        if unknown:
+            raise ValueError(f"unknown setting {', '.join(unknown)}; expected one of {', '.join(sorted(allowed))}")
+        checked.append(params)
+    return checked
+
+def format_params(params):
+    return ' '.join(f'{name}={value}' for name, value in params.items())
+
+def load_policy(spec):
+    # the script is read once here and shipped to the workers with each job
+    kind, _, arg = spec.partition(':')
+    if kind == 'random':
+        return (spec, 'random', int(arg) if arg else 8)
+    if kind == 'idle':
+        return (spec, 'idle', None)
+    if kind == 'script':
+        return (spec, 'script', headless.load_script(arg))
+    raise ValueError(f'unknown policy {spec!r}, expected random[:HOLD], idle or script:PATH')
+
+def policy_inputs(policy, seed):
+    import bench
+    _, kind, arg = policy
+    if kind == 'random':
+        return bench.random_policy(seed, hold=arg)
+    if kind == 'script':
+        return itertools.chain(arg, itertools.repeat(0))
+    return itertools.repeat(0)
+
+def run_episode(job):
+    episode, stage, seed, policy, params, bees, frames = job
+    start = time.perf_counter()
+    simulation = headless.Simulation(stage, seed=seed, player_params=params, bee_params=bees)
+    for buttons in itertools.islice(policy_inputs(policy, seed), frames):
+        if not simulation.step(buttons):
+            break
+    row = {'episode': episode, 'stage': stage, 'seed': seed, 'policy': policy[0],
+           'params': format_params(params), 'bees': format_params(bees)}
+    row.update(simulation.outcome())
+    row['seconds'] = round(time.perf_counter() - start, 4)
+    return row
+
+def summarize(rows):
+    groups = {}
+    for row in rows:
+        groups.setdefault((row['policy'], row['params'], row['bees']), []).append(row)
+    table = []
+    for (policy, params, bees), group in groups.items():
+        exits = [row['frames_to_exit'] for row in group if row['frames_to_exit'] is not None]
+        table.append({
+            'policy': policy, 'params': params or '-', 'bees': bees or '-', 'episodes': len(group),
+            'won': sum(row['result'] == 'won' for row in group),
+            'lost': sum(row['result'] == 'lost' for row in group),
+            'exited': len(exits),
+            'frames_to_exit': f'{sum(exits) / len(exits):.0f}' if exits else '-',
+            'deaths': f"{sum(row['deaths'] for row in group) / len(group):.2f}",
+            'coins': f"{sum(row['coins'] for row in group) / len(group):.2f}",
+        })
+    return table
+
+def format_table(table):
+    if not table:
+        return ''
+    columns = list(table[0])
+    widths = {column: max(len(column), *(len(str(row[column])) for row in table)) for column in columns}
+    lines = ['  '.join(column.ljust(widths[column]) for column in columns)]
+    for row in table:
+        lines.append('  '.join(str(row[column]).ljust(widths[column]) for column in columns))
+    return '\n'.join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description='Play many headless episodes in parallel and collect the outcomes in one table.')
+    parser.add_argument('--episodes', type=int, default=8, help='seeds per combination of parameters and policy')
+    parser.add_argument('--seed', type=int, default=0, help='first seed; episodes use seed, seed + 1, ...')
+    parser.add_argument('--stage', type=int, default=0)
+    parser.add_argument('--frames', type=int, default=3600, help='frame limit per episode')
+    parser.add_argument('--policy', action='append', default=[],
+                        help='random[:HOLD], idle or script:PATH; repeat to compare several (default: random)')
+    parser.add_argument('--param', action='append', default=[], metavar='NAME=V1,V2',
+                        help='player setting to sweep, e.g. speed=4,5,6; repeat for a grid')
+    parser.add_argument('--bee', action='append', default=[], metavar='NAME=V1,V2',
+                        help='bee setting to sweep: patrol (or its old name limit), speed or rest_duration')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='worker processes (1 runs in-process)')
+    parser.add_argument('--output', default='farm.csv', help='per-episode results as .csv')
+    args = parser.parse_args()
+
+    try:
+        policies = [load_policy(spec) for spec in args.policy or ['random']]
+        param_grid = check_grid(parse_grid(args.param), PLAYER_SETTINGS)
+        bee_grid = check_grid(parse_grid(args.bee), bee_settings(), BEE_ALIASES)
+    except (OSError, ValueError) as error:
+        parser.error(str(error))
+    combos = itertools.product(policies, param_grid, bee_grid, range(args.seed, args.seed + args.episodes))
+    jobs = [(episode, args.stage, seed, policy, params, bees, args.frames)
+            for episode, (policy, params, bees, seed) in enumerate(combos)]
+
+    start = time.perf_counter()
+    if args.jobs == 1 or len(jobs) == 1:
+        rows = list(map(run_episode, jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=args.jobs, initializer=headless.boot) as executor:
+            rows = list(executor.map(run_episode, jobs, chunksize=max(1, len(jobs) // (args.jobs * 4))))
+    elapsed = time.perf_counter() - start
+
+    with open(args.output, 'w', newline='') as results_file:
+        writer = csv.DictWriter(results_file, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    print(format_table(summarize(rows)))
+    frames = sum(row['frames'] for row in rows)
+    print(f'{len(rows)} episodes, {frames} frames in {elapsed:.2f}s ({frames / max(elapsed, 1e-9):.0f} frames/s), wrote {args.output}')
+
+if __name__ == '__main__':
+    main()
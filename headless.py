@@ -0,0 +1,195 @@
+import argparse
+import os
+import sys
+import time
+
+FIXED_DT = 1 / 60
+
+_main = None
+
+def boot():
+    global _main
+    if _main is not None:
+        return _main
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    sys._pgzrun = True
+    import pygame
+    from pgzero import loaders
+    loaders.set_root(os.path.dirname(os.path.abspath(__file__)))
+    if pygame.display.get_surface() is None:
+        pygame.display.set_mode((1, 1))
+    import main
+    _main = main
+    return main
+
+def offscreen(size=None):
+    main = boot()
+    import pygame
+    import pgzero.game
+    from pgzero.screen import Screen
+    surface = pygame.Surface(size or (main.WIDTH, main.HEIGHT))
+    main.screen = Screen(surface)
+    pgzero.game.screen = surface
+    return main.screen
+
+def parse_frame(text):
+    buttons = 0
+    for key in text.replace('+', ' ').split():
+        buttons |= boot().BUTTON_BITS[key.lower()]
+    return buttons
+
+def load_script(path):
+    frames = []
+    with open(path) as script:
+        for line in script:
+            line = line.split('#')[0].strip()
+            if not line:
+                continue
+            repeat = 1
+            if '*' in line:
+                line, repeat = line.rsplit('*', 1)
+                repeat = int(repeat)
+            frames.extend([parse_frame(line)] * repeat)
+    return frames
+
+class Simulation:
+    def __init__(self, stage=0, inputs=(), level=None, seed=None, dt=FIXED_DT, session=None,
+                 player_params=None, bee_params=None):
+        self.main = boot()
+        self.world = self.main.World(seed=seed, player_params=player_params, bee_params=bee_params)
+        self.world.stage = stage
+        self.world.replay_session = session
+        self.inputs = list(inputs)
+        self.controls = self.main.ButtonState()
+        self.dt = dt
+        self.frame = 0
+        self.time = 0.0
+        self.stages_cleared = 0
+        self.exit_frame = None
+        self.deaths = 0
+        self.coins = 0
+        self.result = None
+        self.enter(self.world.start(self.main.GameScene(self.world, level)))
+
+    @property
+    def scene(self):
+        return self.world.scene
+
+    def enter(self, scene):
+        if isinstance(scene, self.main.GameScene):
+            scene.player.controls = self.controls
+        elif isinstance(scene, self.main.GameOver):
+            self.result = 'won' if scene.won else 'lost'
+
+    @property
+    def finished(self):
+        return self.result is not None
+
+    def step(self, buttons=None):
+        if self.finished:
+            return False
+        if buttons is None:
+            buttons = self.inputs[self.frame] if self.frame < len(self.inputs) else 0
+        self.controls.set(buttons)
+        scene = self.scene
+        player = scene.player
+        life, respawns = player.life, player.respawns
+        self.main.profiler.begin_frame()
+        self.world.tick()
+        self.main.profiler.end_frame()
+        self.frame += 1
+        self.time += self.dt
+        # an obstacle costs a life and respawns, a pit fall only respawns, the last hit only costs the life
+        self.deaths += max(life - player.life, player.respawns - respawns, 0)
+        if self.scene is not scene:
+            self.coins += len(scene.collected_coins)
+            if isinstance(self.scene, self.main.GameScene) or getattr(self.scene, 'won', False):
+                self.stages_cleared += 1
+                if self.exit_frame is None: self.exit_frame = self.frame
+            self.enter(self.scene)
+        return not self.finished
+
+    def run(self, frames=None):
+        if frames is None:
+            frames = len(self.inputs)
+        for _ in range(frames):
+            if not self.step():
+                break
+        return self.frame
+
+    def state(self):
+        player = self.scene.player if isinstance(self.scene, self.main.GameScene) else None
+        return {
+            'frame': self.frame,
+            'stage': self.world.stage,
+            'result': self.result,
+            'x': player.x if player else None,
+            'y': player.y if player else None,
+            'life': player.life if player else 0,
+            'n_dash': player.n_dash if player else 0,
+        }
+
+    def outcome(self):
+        coins = self.coins
+        if isinstance(self.scene, self.main.GameScene):
+            coins += len(self.scene.collected_coins)
+        return {
+            'result': self.result or 'timeout',
+            'frames': self.frame,
+            'frames_to_exit': self.exit_frame,
+            'stages_cleared': self.stages_cleared,
+            'deaths': self.deaths,
+            'coins': coins,
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the game logic without a window at a fixed timestep.')
+    parser.add_argument('--stage', type=int, default=0)
+    parser.add_argument('--frames', type=int, default=3600)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--script', help='input script: one frame per line, e.g. "right z" or "right * 30"')
+    parser.add_argument('--level', help='compiled .lvl file to play instead of the stage')
+    parser.add_argument('--assets', action='store_true', help='print the asset warm-up report')
+    parser.add_argument('--profile', help='write per-section timings to a .csv file or a Chrome trace .json')
+    parser.add_argument('--record', help='save the run (stage, seed, inputs and state checksums) as a replay file')
+    parser.add_argument('--replay', help='play a replay file back at full speed and verify its checksums')
+    args = parser.parse_args()
+
+    if args.assets:
+        print(boot().assets.report())
+
+    if args.profile:
+        boot().profiler = boot().Profiler(capacity=args.frames)
+
+    inputs = load_script(args.script) if args.script else []
+    level = boot().load_level(args.level) if args.level else None
+    session = None
+    if args.replay:
+        replay = boot().Replay.load(args.replay)
+        session = boot().ReplaySession(replay, playback=True)
+        args.stage, args.seed, inputs, args.frames = replay.stage, replay.seed, list(replay.inputs), len(replay)
+    elif args.record:
+        if level is not None:
+            parser.error('--record only works with --stage, replays do not store custom levels')
+        session = boot().ReplaySession(boot().Replay(args.stage, args.seed))
+    simulation = Simulation(args.stage, inputs, level=level, seed=args.seed, session=session)
+    start = time.perf_counter()
+    frames = simulation.run(args.frames)
+    elapsed = time.perf_counter() - start
+    print(simulation.state())
+    print(f'{frames} frames in {elapsed:.3f}s ({frames / max(elapsed, 1e-9):.0f} frames/s, {frames * simulation.dt:.1f}s of game time)')
+    if args.profile:
+        boot().profiler.dump(args.profile)
+        print(f'wrote {args.profile}')
+    if args.record:
+        session.replay.save(args.record)
+        print(f'recorded {len(session.replay)} frames to {args.record}')
+    if args.replay:
+        if session.desync is not None or session.frame < len(session.replay):
+            print(f'replay failed after {session.frame} of {len(session.replay)} frames')
+            sys.exit(1)
+        print(f'replay ok: {session.frame} frames, {len(session.replay.checksums)} checksums')
+
+if __name__ == '__main__':
+    main()
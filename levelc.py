@@ -0,0 +1,42 @@
+import argparse
+import os
+
+import headless
+
+def read_text_level(path):
+    with open(path) as level_file:
+        return [line.rstrip('\n') for line in level_file]
+
+def write_level(map_data, path):
+    main = headless.boot()
+    data = main.compile_level(map_data)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'wb') as level_file:
+        level_file.write(data)
+    level = main.Level(data, path)
+    print(f'{path}: {level.width}x{level.height} tiles, {len(data)} bytes')
+
+def main():
+    parser = argparse.ArgumentParser(description='Compile text maps into the binary .lvl format.')
+    parser.add_argument('inputs', nargs='*', help='text maps (one row per line); defaults to the built-in MAP0-MAP4')
+    parser.add_argument('-o', '--output-dir', help='where to write the .lvl files (default: levels/)')
+    parser.add_argument('--dump', metavar='LEVEL', help='print a compiled level back as text')
+    args = parser.parse_args()
+
+    main_module = headless.boot()
+    if args.dump:
+        for row_str in main_module.load_level(args.dump):
+            print(row_str)
+        return
+
+    output_dir = args.output_dir or main_module.LEVEL_DIR
+    if args.inputs:
+        for path in args.inputs:
+            name = os.path.splitext(os.path.basename(path))[0] + '.lvl'
+            write_level(read_text_level(path), os.path.join(output_dir, name))
+    else:
+        for stage, map_data in enumerate(main_module.BUILTIN_MAPS):
+            write_level(map_data, os.path.join(output_dir, f'stage{stage}.lvl'))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,287 @@
+import argparse
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import headless
+from levelc import read_text_level
+
+EXIT_TILES = 'C0'
+KNOWN_TILES = ' XGLRFEDCS0PAO'
+MAX_TICKS = 180
+STEER_TICK = 8
+# (direction before STEER_TICK, direction after), so "jump straight up, then drift" is covered too
+STEERING = ((-1, -1), (1, 1), (0, 0), (0, -1), (0, 1))
+DASH_TICKS = (None, 4, 10, 16)
+
+def physics_constants():
+    main = headless.boot()
+    player = main.Player('player/idle/0', (0, 0), [], [])
+    return {
+        'tile': main.TILE_SIZE,
+        'solid': main.PLATFORM_TILES,
+        'screen': (main.WIDTH, main.HEIGHT),
+        'size': (player.width, player.height),
+        'speed': player.speed,
+        'jump_speed': player.jump_speed,
+        'gravity': player.gravity,
+        'max_fall_speed': player.max_fall_speed,
+        # Player.move advances a dash by dash_speed * 5 per tick
+        'dash_step': player.dash_speed * 5,
+        'dash_ticks': player.dash_ticks,
+        'n_dash': player.n_dash,
+        'coin': main.assets.get('coin/0').get_size(),
+        'spike': main.assets.get('obstacles/o2').get_size(),
+    }
+
+def validate(rows):
+    issues = []
+    widths = [len(row_str) for row_str in rows]
+    if len(set(widths)) > 1:
+        width = max(widths)
+        short = [row_idx for row_idx, row_width in enumerate(widths) if row_width != width]
+        issues.append(f'rows of different lengths ({min(widths)}-{width} tiles); rows {short} differ from the widest')
+    starts = [(col_idx, row_idx) for row_idx, row_str in enumerate(rows) for col_idx, char in enumerate(row_str) if char == 'P']
+    if len(starts) != 1:
+        issues.append(f"expected exactly one 'P', found {len(starts)} {starts if starts else ''}".rstrip())
+    if not any(char in row_str for row_str in rows for char in EXIT_TILES):
+        issues.append("no exit ('C' or '0')")
+    unknown = sorted(set(''.join(rows)) - set(KNOWN_TILES))
+    if unknown:
+        issues.append(f'unknown tiles {unknown}')
+    return issues
+
+class LevelModel:
+    def __init__(self, rows, physics):
+        self.rows = rows
+        self.physics = physics
+        self.tile = physics['tile']
+        self.solid_chars = physics['solid']
+        columns = max((len(row_str.rstrip()) for row_str in rows), default=0)
+        self.world_width = max(physics['screen'][0], columns * self.tile)
+        self.world_height = max(physics['screen'][1], len(rows) * self.tile)
+        self.width, self.height = physics['size']
+        self.index()
+
+    def char(self, col_idx, row_idx):
+        if 0 <= row_idx < len(self.rows) and 0 <= col_idx < len(self.rows[row_idx]):
+            return self.rows[row_idx][col_idx]
+        return ' '
+
+    def index(self):
+        self.solids = set()
+        self.items = {}
+        for row_idx, row_str in enumerate(self.rows):
+            for col_idx, char in enumerate(row_str):
+                if char in self.solid_chars:
+                    self.solids.add((col_idx, row_idx))
+                elif char in 'AS' or char in EXIT_TILES:
+                    self.items[(col_idx, row_idx)] = (char == 'S',) + self.item_rect(col_idx, row_idx, char)
+
+    def item_rect(self, col_idx, row_idx, char):
+        size = self.tile
+        x, y = col_idx * size, row_idx * size
+        if char == 'A':
+            width, height = self.physics['coin']
+            return x + (size - width) // 2, y + (size - height) // 2, width, height
+        if char == 'S':
+            width, height = self.physics['spike']
+            return x, y + size - height, width, height
+        return x, y, size, size
+
+    def simulate(self, x, y, jump, steering, dash_tick, dashes, settle=False):
+        # a tile-grid port of Player.update: events, move, x collision, gravity, y collision, reset_dash, limits
+        p = self.physics
+        speed, dash_step, gravity, max_fall = p['speed'], p['dash_step'], p['gravity'], p['max_fall_speed']
+        solids, items = self.solids, self.items
+        half_w, half_h, size = self.width / 2, self.height / 2, self.tile
+        floor, ceil = math.floor, math.ceil
+        # below the last row there is nothing left to land on, so stop instead of falling to world_height + 200
+        death_y, max_x = min(self.world_height + 200, len(self.rows) * size + half_h), self.world_width - 64
+        dx = dy = 0
+        on_ground, can_dash, flip, time_dash = True, False, False, 0
+        start = (int(x // size), int((y + half_h - 1) // size))
+        touched = set()
+        for tick in range(MAX_TICKS):
+            if not can_dash:
+                dx = steering[0] if tick < STEER_TICK else steering[1]
+                if dx: flip = dx < 0
+                if jump and tick == 0 and on_ground:
+                    on_ground = False
+                    dy = p['jump_speed']
+                if tick == dash_tick and not on_ground and dashes > 0:
+                    can_dash = True
+                    dashes -= 1
+                    dx = -1 if flip else 1
+                    dy = 0
+            x += (-dash_step if flip else dash_step) if can_dash else dx * speed
+            if dx:
+                top_row, bottom_row = floor((y - half_h) / size), ceil((y + half_h) / size)
+                for col_idx in range(floor((x - half_w) / size), ceil((x + half_w) / size)):
+                    for row_idx in range(top_row, bottom_row):
+                        if (col_idx, row_idx) in solids:
+                            if dx > 0: x = min(x, col_idx * size - half_w)
+                            else: x = max(x, (col_idx + 1) * size + half_w)
+                            break
+            if not can_dash:
+                if dy < max_fall:
+                    dy += gravity
+                y += dy
+            landed = False
+            if dy:
+                left_col, right_col = floor((x - half_w) / size), ceil((x + half_w) / size)
+                for row_idx in range(floor((y - half_h) / size), ceil((y + half_h) / size)):
+                    if dy and any((col_idx, row_idx) in solids for col_idx in range(left_col, right_col)):
+                        if dy > 0:
+                            y = row_idx * size - half_h
+                            on_ground = landed = True
+                        else:
+                            y = (row_idx + 1) * size + half_h
+                        dy = 0
+            if can_dash:
+                time_dash += 1
+                if time_dash >= p['dash_ticks']:
+                    can_dash, time_dash, dx = False, 0, 0
+            if y > death_y:
+                return None, dashes, touched
+            x = max(64, min(x, max_x))
+            left, top, right, bottom = x - half_w, y - half_h, x + half_w, y + half_h
+            for row_idx in range(floor(top / size), ceil(bottom / size)):
+                for col_idx in range(floor(left / size), ceil(right / size)):
+                    item = items.get((col_idx, row_idx))
+                    if item is None: continue
+                    hazard, item_x, item_y, item_w, item_h = item
+                    if left < item_x + item_w and right > item_x and top < item_y + item_h and bottom > item_y:
+                        if hazard:
+                            return None, dashes, touched
+                        touched.add((col_idx, row_idx))
+            if landed and not can_dash:
+                node = (int(x // size), int((bottom - 1) // size))
+                if settle or node != start or (jump and tick > 0):
+                    return node, dashes, touched
+        return None, dashes, touched
+
+    def stand(self, node):
+        col_idx, row_idx = node
+        return col_idx * self.tile + self.tile / 2, (row_idx + 1) * self.tile - self.height / 2
+
+    def programs(self, dashes):
+        yield False, (-1, -1), None
+        yield False, (1, 1), None
+        for steering in STEERING:
+            for dash_tick in DASH_TICKS:
+                if dash_tick is None or dashes > 0:
+                    yield True, steering, dash_tick
+
+    def explore(self, start):
+        # settle the player where Scene.generate_map drops it, then flood the (tile, dashes left) graph
+        spawn, _, touched = self.simulate(start[0], start[1], False, (0, 0), None, 0, settle=True)
+        if spawn is None:
+            return set(), touched
+        frontier = [(spawn, self.physics['n_dash'])]
+        visited = set(frontier)
+        moves = {}
+        while frontier:
+            node, dashes = frontier.pop()
+            for program in self.programs(dashes):
+                key = (node, program)
+                if key not in moves:
+                    moves[key] = self.simulate(*self.stand(node), *program, dashes=1 if program[2] is not None else 0)
+                landing, left_over, reached = moves[key]
+                touched |= reached
+                if landing is None:
+                    continue
+                state = (landing, dashes - (1 - left_over if program[2] is not None else 0))
+                if state not in visited:
+                    visited.add(state)
+                    frontier.append(state)
+        return {node for node, _ in visited}, touched
+
+def check_level(job):
+    name, rows, physics = job
+    start_time = time.perf_counter()
+    issues = validate(rows)
+    report = {'name': name, 'issues': issues, 'exit': False, 'coins': 0, 'coins_reachable': 0,
+              'unreachable_coins': [], 'nodes': 0}
+    starts = [(col_idx, row_idx) for row_idx, row_str in enumerate(rows) for col_idx, char in enumerate(row_str) if char == 'P']
+    coins = {(col_idx, row_idx) for row_idx, row_str in enumerate(rows) for col_idx, char in enumerate(row_str) if char == 'A'}
+    exits = {(col_idx, row_idx) for row_idx, row_str in enumerate(rows) for col_idx, char in enumerate(row_str) if char in EXIT_TILES}
+    report['coins'] = len(coins)
+    if starts:
+        model = LevelModel(rows, physics)
+        col_idx, row_idx = starts[0]
+        nodes, touched = model.explore((col_idx * physics['tile'], row_idx * physics['tile']))
+        report['nodes'] = len(nodes)
+        report['exit'] = bool(exits & touched)
+        report['coins_reachable'] = len(coins & touched)
+        report['unreachable_coins'] = sorted(coins - touched)
+    report['ok'] = not issues and report['exit'] and not report['unreachable_coins']
+    report['seconds'] = time.perf_counter() - start_time
+    return report
+
+def format_report(report):
+    status = 'ok' if report['ok'] else 'FAIL'
+    line = (f"{status:4} {report['name']}: exit {'reachable' if report['exit'] else 'UNREACHABLE'}, "
+            f"coins {report['coins_reachable']}/{report['coins']}, {report['nodes']} standing tiles, {report['seconds'] * 1000:.0f} ms")
+    details = [f'       - {issue}' for issue in report['issues']]
+    if report['unreachable_coins']:
+        details.append(f"       - unreachable coins (col, row): {report['unreachable_coins']}")
+    return '\n'.join([line] + details)
+
+def print_reports(reports, quiet=False):
+    # reports are printed as they arrive, so a long --generate run shows progress
+    failed = 0
+    for report in reports:
+        failed += not report['ok']
+        if not quiet or not report['ok']:
+            print(format_report(report))
+    return failed
+
+def collect_levels(args):
+    main = headless.boot()
+    levels = []
+    if not args.inputs and not args.generate:
+        for stage, map_data in enumerate(main.WORLD_MAP):
+            levels.append((getattr(map_data, 'name', None) or f'stage{stage}', list(map_data)))
+    if args.builtin:
+        for index, map_data in enumerate(main.BUILTIN_MAPS):
+            levels.append((f'MAP{index}', list(map_data)))
+    for path in args.inputs:
+        rows = list(main.load_level(path)) if path.endswith('.lvl') else read_text_level(path)
+        levels.append((os.path.basename(path), rows))
+    if args.generate:
+        import bench
+        width, height = (int(value) for value in args.size.lower().split('x'))
+        for index in range(args.generate):
+            rows = bench.generate_level(width, height, seed=args.seed + index)
+            rows[height - 4] = rows[height - 4][:-1] + 'C'
+            levels.append((f'generated-{args.seed + index}', rows))
+    return levels
+
+def main():
+    parser = argparse.ArgumentParser(description='Validate levels and check that the exit and every coin can be reached.')
+    parser.add_argument('inputs', nargs='*', help='.lvl files or text maps; defaults to every stage in the world map')
+    parser.add_argument('--builtin', action='store_true', help='also check the text maps MAP0-MAP4')
+    parser.add_argument('--generate', type=int, default=0, metavar='N', help='check N levels from bench.generate_level')
+    parser.add_argument('--size', default='20x12', help='size of generated levels in tiles')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='worker processes (1 runs in-process)')
+    parser.add_argument('--quiet', action='store_true', help='only print failing levels and the summary')
+    args = parser.parse_args()
+
+    physics = physics_constants()
+    jobs = [(name, rows, physics) for name, rows in collect_levels(args)]
+    start = time.perf_counter()
+    if args.jobs == 1 or len(jobs) == 1:
+        failed = print_reports(map(check_level, jobs), args.quiet)
+    else:
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            failed = print_reports(pool.map(check_level, jobs, chunksize=max(1, len(jobs) // (args.jobs * 4))), args.quiet)
+    elapsed = time.perf_counter() - start
+    print(f'{len(jobs)} levels checked in {elapsed:.2f}s, {failed} failing')
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -2,14 +2,74 @@ import pgzrun
 import random
 from pgzero.builtins import * # type: ignore
 from pgzero.rect import Rect
+from pgzero import loaders, ptext
+from collections import OrderedDict, deque
+import csv
+import json
 import math
+import mmap
+import numpy as np
+import os
+import pygame
+import struct
+import time
+import zlib
 
 WIDTH = 1280
 HEIGHT = 720
 COLOR_BG = (20, 20, 30)
 TILE_SIZE = 64
-n_stage = 0
-sound_enabled = True
+COLLISION_MARGIN = TILE_SIZE // 2
+PLATFORM_TILES = 'XGLRFED'
+UPDATE_MARGIN = TILE_SIZE * 4
+CHUNK_COLUMNS = 24
+CHUNK_LOAD_MARGIN = TILE_SIZE * 8
+MAX_LIVE_CHUNKS = 4
+PAGE_ROWS = 12
+MAX_STATIC_PAGES = 8
+TEXT_CACHE_SIZE = 64
+PRELOAD_BUDGET = 0.004
+PRELOAD_BATCH = 64
+PAGE_BAND_ROWS = 1
+CROSSFADE_TIME = 0.3
+LAYER_STATIC, LAYER_ANIMATED, LAYER_DYNAMIC, LAYER_OVERLAY = 0, 1, 2, 3
+MAX_DIRTY_RECTS = 24
+DIRTY_FULL_RATIO = 0.5
+# pgzero's runner overwrites __file__ with its own builtins module, but sets the loader root to the game folder first
+GAME_DIR = os.path.abspath(loaders.root)
+IMAGE_DIR = os.path.join(GAME_DIR, 'images')
+ATLAS_INDEX = os.path.join(IMAGE_DIR, 'atlas', 'atlas.json')
+LEVEL_DIR = os.path.join(GAME_DIR, 'levels')
+SOUND_DIR = os.path.join(GAME_DIR, 'sounds')
+MUSIC_DIR = os.path.join(GAME_DIR, 'music')
+SOUND_POOLS = {'player': 2, 'pickup': 2, 'hazard': 1}
+SOUND_EFFECTS = { # name: (pool, priority, minimum seconds between plays)
+    'jump': ('player', 1, 0.05),
+    'dash': ('player', 2, 0.05),
+    'coin': ('pickup', 0, 0.06),
+    'death': ('hazard', 3, 0.25),
+}
+MUSIC_FADE_MS = 600
+FONT_SIZES = (24, 30)
+MAX_PARTICLES = 20000
+TICK_RATE = 60
+MAX_SUBSTEPS = 5
+PROFILE_FRAMES = 300
+LEVEL_MAGIC = b'PLVL'
+LEVEL_VERSION = 1
+LEVEL_HEADER = struct.Struct('<4sHHHI')
+LEVEL_ENTITY = struct.Struct('<cHH')
+LEVEL_TILES = ' XGLRFEDCS0'
+LEVEL_ENTITIES = 'PAO'
+REPLAY_MAGIC = b'PRPL'
+REPLAY_VERSION = 1
+REPLAY_HEADER = struct.Struct('<4sHHIII')
+REPLAY_STATE = struct.Struct('<ddhhhI')
+REPLAY_CHECKSUM_INTERVAL = 1
+REPLAY_PATH = 'replay.rpl'
+INPUT_BUTTONS = ('left', 'right', 'z', 'x')
+LEFT, RIGHT, JUMP, DASH = (1 << bit for bit in range(len(INPUT_BUTTONS)))
+BUTTON_BITS = dict(zip(INPUT_BUTTONS, (LEFT, RIGHT, JUMP, DASH)))
 
 class Vector2:
     def __init__(self, x, y):
@@ -26,6 +86,211 @@ class State:
     JUMP_LEFT = 7
     IDLE_LEFT = 8
 
+class AssetRegistry:
+    def __init__(self, image_dir=IMAGE_DIR):
+        self.image_dir = image_dir
+        self.surfaces = {}
+        self.sheets = {}
+        self.frame_lists = {}
+        self.groups = {}
+
+    def register(self, name, surface):
+        self.surfaces[name] = surface
+        for alias in (name, name + '.png'):
+            images.cache[images.cache_key(alias, (), {})] = surface # type: ignore
+
+    def record(self, group_name, start, surface):
+        group = self.groups.setdefault(group_name, {'count': 0, 'seconds': 0.0, 'bytes': 0})
+        group['count'] += 1
+        group['seconds'] += time.perf_counter() - start
+        group['bytes'] += surface.get_width() * surface.get_height() * surface.get_bytesize()
+
+    def load_atlases(self, index_path=ATLAS_INDEX):
+        if not os.path.isfile(index_path):
+            print(f"no sprite atlas at {index_path}, loading every frame on its own (run python atlas.py)")
+            return set()
+        with open(index_path) as index_file:
+            index = json.load(index_file)
+        covered = set()
+        for sheet_name, sheet_info in index['sheets'].items():
+            start = time.perf_counter()
+            sheet = pygame.image.load(os.path.join(os.path.dirname(index_path), sheet_info['image'])).convert_alpha()
+            self.sheets[sheet_name] = sheet
+            for name, rect in sheet_info['frames'].items():
+                self.register(name, sheet.subsurface(rect))
+                covered.add(name)
+            self.record('atlas', start, sheet)
+        return covered
+
+    def warm_up(self, font_sizes=FONT_SIZES):
+        covered = self.load_atlases()
+        atlas_dir = os.path.dirname(ATLAS_INDEX)
+        for folder, _, files in sorted(os.walk(self.image_dir)):
+            if folder == atlas_dir:
+                continue
+            for file_name in sorted(files):
+                if not file_name.endswith('.png'):
+                    continue
+                path = os.path.join(folder, file_name)
+                name = os.path.relpath(path, self.image_dir)[:-len('.png')].replace(os.sep, '/')
+                if name in covered:
+                    continue
+                start = time.perf_counter()
+                surface = pygame.image.load(path).convert_alpha()
+                self.register(name, surface)
+                self.record(name.split('/')[0], start, surface)
+        start = time.perf_counter()
+        for size in font_sizes:
+            ptext.getfont(fontsize=size)
+        self.groups['fonts'] = {'count': len(font_sizes), 'seconds': time.perf_counter() - start, 'bytes': 0}
+
+    def get(self, name):
+        if name.endswith('.png'):
+            name = name[:-len('.png')]
+        surface = self.surfaces.get(name)
+        if surface is None:
+            surface = images.load(name) # type: ignore
+            self.register(name, surface)
+        return surface
+
+    def frames(self, path, n_frame):
+        key = (path, n_frame)
+        if key not in self.frame_lists:
+            self.frame_lists[key] = [self.get(f'{path}{index}') for index in range(n_frame)]
+        return self.frame_lists[key]
+
+    def report(self):
+        lines = [f"{'group':<10} {'files':>5} {'load ms':>9} {'memory KB':>10}"]
+        for group, stats in sorted(self.groups.items()):
+            lines.append(f"{group:<10} {stats['count']:>5} {stats['seconds'] * 1000:>9.2f} {stats['bytes'] / 1024:>10.1f}")
+        total_seconds = sum(stats['seconds'] for stats in self.groups.values())
+        total_bytes = sum(stats['bytes'] for stats in self.groups.values())
+        lines.append(f"{'total':<10} {sum(stats['count'] for stats in self.groups.values()):>5} {total_seconds * 1000:>9.2f} {total_bytes / 1024:>10.1f}")
+        return '\n'.join(lines)
+
+assets = AssetRegistry()
+
+class TextCache:
+    def __init__(self, max_entries=TEXT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, text, pos=None, **options):
+        key = (text, pos, tuple(sorted(options.items())))
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry
+        self.misses += 1
+        # surf=None makes ptext lay out and rasterize without blitting; we keep the result instead of its cache
+        entry = ptext.draw(text, pos, surf=None, cache=False, **options)
+        self.entries[key] = entry
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return entry
+
+    def draw(self, screen_surface, text, pos=None, **options):
+        surface, position = self.render(text, pos, **options)
+        screen_surface.surface.blit(surface, position)
+
+text_cache = TextCache()
+
+class NullMixer:
+    enabled = False
+
+    def load(self): pass
+    def play(self, name): pass
+    def play_music(self, name): pass
+    def update(self): pass
+    def set_enabled(self, enabled): pass
+
+class AudioMixer:
+    def __init__(self, sound_dir=SOUND_DIR, music_dir=MUSIC_DIR):
+        self.sound_dir = sound_dir
+        self.music_dir = music_dir
+        self.enabled = True
+        self.sounds = {}
+        self.tracks = {}
+        self.pools = {}
+        self.last_played = {}
+        self.track = None
+        self.pending = None
+
+    def load(self):
+        for name in os.listdir(self.sound_dir):
+            if name.endswith('.wav'):
+                self.sounds[name[:-len('.wav')]] = pygame.mixer.Sound(os.path.join(self.sound_dir, name))
+        total = sum(SOUND_POOLS.values())
+        pygame.mixer.set_num_channels(max(pygame.mixer.get_num_channels(), total))
+        # reserved channels are never handed out by find_channel(), so pgzero's sounds.* can't steal them
+        pygame.mixer.set_reserved(total)
+        channels = [pygame.mixer.Channel(index) for index in range(total)]
+        for pool, count in SOUND_POOLS.items():
+            self.pools[pool] = [[channel, 0, 0.0] for channel in channels[:count]]
+            channels = channels[count:]
+
+    def play(self, name):
+        if not self.enabled or name not in self.sounds:
+            return
+        pool, priority, interval = SOUND_EFFECTS[name]
+        now = time.perf_counter()
+        if now - self.last_played.get(name, -interval) < interval:
+            return
+        voices = self.pools[pool]
+        voice = next((voice for voice in voices if not voice[0].get_busy()), None)
+        if voice is None:
+            # steal the lowest-priority, oldest voice, but never one that outranks the new sound
+            voice = min(voices, key=lambda voice: (voice[1], voice[2]))
+            if voice[1] > priority:
+                return
+        voice[0].play(self.sounds[name])
+        voice[1], voice[2] = priority, now
+        self.last_played[name] = now
+
+    def music(self, name):
+        # only the path is kept: pygame.mixer.music streams the file instead of decoding it up front
+        if name not in self.tracks:
+            paths = [os.path.join(self.music_dir, file_name) for file_name in sorted(os.listdir(self.music_dir))
+                     if os.path.splitext(file_name)[0] == name]
+            self.tracks[name] = paths[0] if paths else None
+            if not paths: print(f"'{name}': no music file in {self.music_dir}")
+        return self.tracks[name]
+
+    def play_music(self, name):
+        if name == self.track:
+            return
+        self.track = name
+        self.pending = self.music(name)
+        if pygame.mixer.music.get_busy():
+            pygame.mixer.music.fadeout(MUSIC_FADE_MS)
+        self.update()
+
+    def update(self):
+        # the next track fades in once the old one has faded out; loading it earlier would block on the fade
+        if self.pending is None or pygame.mixer.music.get_busy():
+            return
+        pygame.mixer.music.load(self.pending)
+        pygame.mixer.music.set_volume(1.0 if self.enabled else 0.0)
+        pygame.mixer.music.play(loops=-1, fade_ms=MUSIC_FADE_MS)
+        self.pending = None
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        pygame.mixer.music.set_volume(1.0 if enabled else 0.0)
+        if not enabled:
+            for voices in self.pools.values():
+                for voice in voices: voice[0].stop()
+
+def create_mixer():
+    if os.environ.get('SDL_AUDIODRIVER') == 'dummy' or not pygame.mixer.get_init():
+        return NullMixer()
+    return AudioMixer()
+
+audio = create_mixer()
+
 class AnimatedSprite:
     def __init__(self, path, n_frame, speed_animation=5):
         self.path = path
@@ -33,15 +298,165 @@ class AnimatedSprite:
         self.speed_animation = speed_animation
         self.time = 0
         self.frame = 0
+        self.frames = assets.frames(path, n_frame)
     
     def animation(self):
         self.time += 1
         if self.time > self.speed_animation:
             self.time = 0
             self.frame = (self.frame + 1) % self.n_frame
-        return f'{self.path}{self.frame}'
+        return self.frames[self.frame]
+
+class SpatialGrid:
+    def __init__(self, objects=(), cell_size=TILE_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.entries = {}
+        self.counter = 0
+        for obj in objects:
+            self.insert(obj)
+
+    def cell_span(self, rect, margin=0):
+        size = self.cell_size
+        return (int((rect.left - margin) // size), int((rect.top - margin) // size),
+                int((rect.right + margin) // size), int((rect.bottom + margin) // size))
+
+    def insert(self, obj):
+        span = self.cell_span(obj)
+        self.entries[id(obj)] = (self.counter, obj, span)
+        self.counter += 1
+        self.add_to_cells(obj, span)
+
+    def add_to_cells(self, obj, span):
+        left, top, right, bottom = span
+        for cell_x in range(left, right + 1):
+            for cell_y in range(top, bottom + 1):
+                self.cells.setdefault((cell_x, cell_y), []).append(obj)
+
+    def remove_from_cells(self, obj, span):
+        left, top, right, bottom = span
+        for cell_x in range(left, right + 1):
+            for cell_y in range(top, bottom + 1):
+                cell = self.cells.get((cell_x, cell_y))
+                if cell is None: continue
+                for index, item in enumerate(cell):
+                    if item is obj:
+                        cell[index] = cell[-1]
+                        cell.pop()
+                        break
+                if not cell: del self.cells[(cell_x, cell_y)]
+
+    def remove(self, obj):
+        entry = self.entries.pop(id(obj), None)
+        if entry is not None:
+            self.remove_from_cells(obj, entry[2])
+
+    def move(self, obj):
+        entry = self.entries.get(id(obj))
+        if entry is None:
+            return self.insert(obj)
+        order, _, old_span = entry
+        new_span = self.cell_span(obj)
+        if new_span != old_span:
+            self.remove_from_cells(obj, old_span)
+            self.add_to_cells(obj, new_span)
+            self.entries[id(obj)] = (order, obj, new_span)
+
+    def query(self, rect, margin=0):
+        left, top, right, bottom = self.cell_span(rect, margin)
+        found = {}
+        for cell_x in range(left, right + 1):
+            for cell_y in range(top, bottom + 1):
+                for obj in self.cells.get((cell_x, cell_y), ()):
+                    found[id(obj)] = obj
+        if len(found) < 2:
+            return list(found.values())
+        # keep the insertion order of the original collision list so resolution matches a full scan
+        return sorted(found.values(), key=lambda obj: self.entries[id(obj)][0])
+
+class TriggerIndex:
+    def __init__(self, kinds):
+        self.grid = SpatialGrid()
+        self.kinds = {kind: [] for kind in kinds}
+        self.slots = {}
+
+    def __contains__(self, obj):
+        return id(obj) in self.slots
+
+    def add(self, obj):
+        items = self.kinds[obj.name]
+        self.slots[id(obj)] = len(items)
+        items.append(obj)
+        self.grid.insert(obj)
+        obj.grids.append(self.grid)
+
+    def remove(self, obj):
+        slot = self.slots.pop(id(obj), None)
+        if slot is None: return
+        items = self.kinds[obj.name]
+        last = items.pop()
+        if last is not obj:
+            items[slot] = last
+            self.slots[id(last)] = slot
+        self.grid.remove(obj)
+        if self.grid in obj.grids: obj.grids.remove(self.grid)
+
+    def hits(self, rect):
+        return [obj for obj in self.grid.query(rect) if rect.colliderect(obj)]
+
+class Solid(ZRect): # type: ignore
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.name = "platform"
+        self.grids = []
+
+def merge_solid_tiles(map_data, first_col=0, last_col=None, solid_chars=PLATFORM_TILES):
+    spans = []
+    open_spans = {}
+    for row_idx, row_str in enumerate(map_data):
+        row_spans = {}
+        col_idx = first_col
+        end_col = len(row_str) if last_col is None else min(last_col, len(row_str))
+        while col_idx < end_col:
+            if row_str[col_idx] not in solid_chars:
+                col_idx += 1
+                continue
+            run_start = col_idx
+            while col_idx < end_col and row_str[col_idx] in solid_chars:
+                col_idx += 1
+            run = (run_start, col_idx)
+            span = open_spans.get(run)
+            if span is None:
+                span = [run_start, row_idx, col_idx - run_start, 1]
+                spans.append(span)
+            else:
+                span[3] += 1
+            row_spans[run] = span
+        open_spans = row_spans
+    return [Solid(col * TILE_SIZE, row * TILE_SIZE, cols * TILE_SIZE, rows * TILE_SIZE) for col, row, cols, rows in spans]
+
+def run_steps(steps):
+    # drives a loading generator to the end in one go and hands back what it returned
+    while True:
+        try:
+            next(steps)
+        except StopIteration as stop:
+            return stop.value
+
+def find_start(map_data):
+    for row_idx, row_str in enumerate(map_data):
+        col_idx = row_str.find('P')
+        if col_idx != -1:
+            return col_idx * TILE_SIZE, row_idx * TILE_SIZE
+    return None
+
+def level_size(map_data):
+    columns = max((len(row_str.rstrip()) for row_str in map_data), default=0)
+    return max(WIDTH, columns * TILE_SIZE), max(HEIGHT, len(map_data) * TILE_SIZE)
 
 class GameObject(Actor): # type: ignore
+    layer = LAYER_STATIC
+
     def __init__(self, image, position, *groups):
         super().__init__(image, position)
         self.topleft = position 
@@ -52,24 +467,103 @@ class GameObject(Actor): # type: ignore
                 group_item.append(self)
         self.time = 0
         self.frame = 0
+        self.grids = []
+        self.previous = None
 
     def update(self):
         pass
 
+    def snapshot(self):
+        self.previous = (self.x, self.y)
+
+    def interpolation(self, alpha=1.0):
+        if self.previous is None or alpha >= 1:
+            return (0, 0)
+        return ((self.previous[0] - self.x) * (1 - alpha), (self.previous[1] - self.y) * (1 - alpha))
+
+    def set_surface(self, surface):
+        if surface is self._surf:
+            return
+        resized = surface.get_size() != self._surf.get_size()
+        self._orig_surf = self._surf = surface
+        if resized:
+            self._update_pos()
+
+    def draw(self, offset=(0, 0), alpha=1.0):
+        dx, dy = self.interpolation(alpha)
+        screen.blit(self._surf, (self.left + dx - offset[0], self.top + dy - offset[1])) # type: ignore
+
 class Obj(GameObject):
     def __init__(self, image, position, *groups):
         super().__init__(image, position, *groups)
     
-    def animation(self, path, total_frames, speed=5):
-        self.time += 1
-        if self.time > speed:
-            self.time = 0
-            self.frame = (self.frame + 1) % total_frames
-        return f"{path}{self.frame}"
-    
     def update(self):
         pass
 
+def blit_sprites(surface, sprites, offset=(0, 0), alpha=1.0):
+    # one Surface.blits call in place of a GameObject.draw per sprite, same order and positions
+    batch = []
+    for sprite in sprites:
+        dx, dy = sprite.interpolation(alpha)
+        batch.append((sprite._surf, (sprite.left + dx - offset[0], sprite.top + dy - offset[1])))
+    if batch: surface.blits(batch, doreturn=False)
+
+NO_OP_UPDATES = (GameObject.update, Obj.update)
+
+class SpriteGroup:
+    # a scene's sprites as one insertion-ordered dict per layer: add/remove are O(1) and keep draw order,
+    # layers are sorted when a new one appears rather than every frame, and update() only visits members
+    # whose class does something in update()
+    def __init__(self, sprites=()):
+        self.layers = {}
+        self.updating = {}
+        self.extend(sprites)
+
+    def __len__(self):
+        return sum(len(members) for members in self.layers.values())
+
+    def __iter__(self):
+        for members in self.layers.values():
+            yield from members.values()
+
+    def __contains__(self, sprite):
+        return id(sprite) in self.layers.get(sprite.layer, ())
+
+    def append(self, sprite):
+        members = self.layers.get(sprite.layer)
+        if members is None:
+            members = self.layers[sprite.layer] = {}
+            self.layers = dict(sorted(self.layers.items()))
+        members[id(sprite)] = sprite
+        if type(sprite).update not in NO_OP_UPDATES:
+            self.updating[id(sprite)] = sprite
+
+    def extend(self, sprites):
+        for sprite in sprites:
+            self.append(sprite)
+
+    def remove(self, sprite):
+        members = self.layers.get(sprite.layer)
+        if members is not None: members.pop(id(sprite), None)
+        self.updating.pop(id(sprite), None)
+
+    def update(self):
+        for sprite in list(self.updating.values()):
+            sprite.update()
+
+    def draw(self, surface, offset=(0, 0), alpha=1.0):
+        for members in self.layers.values():
+            run = []
+            for sprite in members.values():
+                if type(sprite).draw is GameObject.draw:
+                    run.append(sprite)
+                    continue
+                blit_sprites(surface, run, offset, alpha)
+                run = []
+                if isinstance(sprite, GameObject): sprite.draw(offset, alpha)
+                else: sprite.draw()
+            blit_sprites(surface, run, offset, alpha)
+
 class BgAnimated(GameObject): 
     def __init__(self, image, y_position):
         super().__init__(image, (0, y_position))
@@ -81,66 +575,204 @@ class BgAnimated(GameObject):
             self.y = start_position
 
     def draw(self):
-        screen.blit(self.image, (0, self.y)) # type: ignore
+        screen.blit(self._surf, (0, self.y)) # type: ignore
+
+class EntityStore:
+    COLUMNS = {}
+
+    def __init__(self, capacity=64):
+        self.capacity = 0
+        self.proxies = []
+        self.free = []
+        self.grow(capacity)
+
+    def __len__(self):
+        return self.capacity - len(self.free)
+
+    def grow(self, capacity):
+        for name, dtype in self.COLUMNS.items():
+            column = np.zeros(capacity, dtype=dtype)
+            if self.capacity: column[:self.capacity] = getattr(self, name)
+            setattr(self, name, column)
+        self.proxies.extend([None] * (capacity - self.capacity))
+        self.free.extend(range(capacity - 1, self.capacity - 1, -1))
+        self.capacity = capacity
+
+    def add(self, proxy):
+        if not self.free: self.grow(self.capacity * 2)
+        slot = self.free.pop()
+        for name in self.COLUMNS: getattr(self, name)[slot] = 0
+        self.proxies[slot] = proxy
+        proxy.store, proxy.slot = self, slot
+        return slot
+
+    def release(self, proxy):
+        if self.proxies[proxy.slot] is proxy:
+            self.proxies[proxy.slot] = None
+            self.free.append(proxy.slot)
+
+    def slots(self, proxies):
+        return np.fromiter((proxy.slot for proxy in proxies if proxy.store is self), dtype=np.intp)
+
+class BeeStore(EntityStore):
+    MOVING, RESTING = 0, 1
+    COLUMNS = {'x': np.float64, 'start': np.float64, 'end': np.float64, 'target': np.float64,
+               'state': np.int8, 'anim_timer': np.int32, 'rest_timer': np.int32, 'frame': np.int8}
+    SPEED = 1.0
+    PATROL = 200.0
+    WALK_ANIMATION_SPEED = 15
+    REST_DURATION = 60
+
+    def __init__(self, capacity=64, patrol=PATROL, speed=SPEED, rest_duration=REST_DURATION):
+        super().__init__(capacity)
+        self.patrol = patrol
+        self.speed = speed
+        self.rest_duration = rest_duration
+        self.walk_frames = [assets.get('obstacles/bee_a'), assets.get('obstacles/bee_b')]
+        self.rest_frame = assets.get('obstacles/bee_rest')
+
+    def add(self, proxy):
+        slot = super().add(proxy)
+        self.x[slot] = self.start[slot] = float(proxy.x)
+        self.end[slot] = self.target[slot] = self.start[slot] + self.patrol
+        return slot
+
+    def update(self, proxies):
+        slots = self.slots(proxies)
+        if not len(slots): return
+        state = self.state[slots]
+        moving, resting = slots[state == self.MOVING], slots[state == self.RESTING]
+
+        x, target = self.x[moving], self.target[moving]
+        forward, back = x < target, x > target
+        x = np.where(forward, x + self.speed, np.where(back, x - self.speed, x))
+        arrived = (forward & (x >= target)) | (back & (x <= target))
+        self.x[moving] = np.where(arrived, target, x)
+        stopped, walking = moving[arrived], moving[~arrived]
+        self.state[stopped] = self.RESTING
+        self.rest_timer[stopped] = 0
+
+        self.anim_timer[walking] += 1
+        flipped = walking[self.anim_timer[walking] >= self.WALK_ANIMATION_SPEED]
+        self.anim_timer[flipped] = 0
+        self.frame[flipped] = (self.frame[flipped] + 1) % len(self.walk_frames)
+
+        self.rest_timer[resting] += 1
+        woken = resting[self.rest_timer[resting] >= self.rest_duration]
+        self.state[woken] = self.MOVING
+        self.target[woken] = np.where(self.target[woken] == self.end[woken], self.start[woken], self.end[woken])
+
+        for slot in moving.tolist():
+            bee = self.proxies[slot]
+            bee.x = float(self.x[slot])
+            for grid in bee.grids: grid.move(bee)
+        for slot in stopped.tolist():
+            self.proxies[slot].set_surface(self.rest_frame)
+        for slot in flipped.tolist() + woken.tolist():
+            self.proxies[slot].set_surface(self.walk_frames[self.frame[slot]])
+
+class CoinStore(EntityStore):
+    COLUMNS = {'time': np.int32, 'frame': np.int8}
+    FRAMES = 5
+    ANIMATION_SPEED = 5
+
+    def update(self, proxies):
+        slots = self.slots(proxies)
+        if not len(slots): return
+        self.time[slots] += 1
+        wrapped = slots[self.time[slots] > self.ANIMATION_SPEED]
+        self.time[wrapped] = 0
+        self.frame[wrapped] = (self.frame[wrapped] + 1) % self.FRAMES
+        frames = assets.frames('coin/', self.FRAMES)
+        for slot in wrapped.tolist():
+            self.proxies[slot].set_surface(frames[self.frame[slot]])
 
 class Bee(GameObject): 
-    def __init__(self, image_dummy_arg, position, *groups): 
-        self.walk_frames = ['obstacles/bee_a', 'obstacles/bee_b'] 
-        self.rest_frame = 'obstacles/bee_rest'      
-        super().__init__(self.rest_frame, position, *groups) 
-        self.limit = 200.0
-        self.patrol_start_x = float(self.x)
-        self.patrol_end_x = float(self.x) + self.limit
-        self.current_target_x = self.patrol_end_x 
-        self.speed = 1.0
-        self.STATE_MOVING = "moving"
-        self.STATE_RESTING = "resting"
-        self.state = self.STATE_MOVING 
-        self.animation_timer = 0
-        self.walk_animation_speed = 15 
-        self.rest_duration = 60    
-        self.rest_timer = 0
-        self.current_walk_frame_index = 0
-        
+    layer = LAYER_DYNAMIC
+
+    def __init__(self, image, position, *groups, store):
+        super().__init__(image, position, *groups) 
+        store.add(self)
+
     def update(self):
-        if self.state == self.STATE_MOVING:
-            if self.x < self.current_target_x:
-                self.x += self.speed
-                if self.x >= self.current_target_x:
-                    self.x = self.current_target_x
-                    self.state = self.STATE_RESTING
-                    self.image = self.rest_frame
-                    self.rest_timer = 0
-            elif self.x > self.current_target_x:
-                self.x -= self.speed
-                if self.x <= self.current_target_x:
-                    self.x = self.current_target_x
-                    self.state = self.STATE_RESTING
-                    self.image = self.rest_frame
-                    self.rest_timer = 0
-            
-            if self.state == self.STATE_MOVING:
-                self.animation_timer += 1
-                if self.animation_timer >= self.walk_animation_speed:
-                    self.animation_timer = 0
-                    self.current_walk_frame_index = (self.current_walk_frame_index + 1) % len(self.walk_frames)
-                    self.image = self.walk_frames[self.current_walk_frame_index]
-        
-        elif self.state == self.STATE_RESTING:
-            self.rest_timer += 1
-            if self.rest_timer >= self.rest_duration:
-                self.state = self.STATE_MOVING
-                if self.current_target_x == self.patrol_end_x:
-                    self.current_target_x = self.patrol_start_x
-                else:
-                    self.current_target_x = self.patrol_end_x
-                self.image = self.walk_frames[self.current_walk_frame_index]
+        self.store.update([self])
 
 class Button(GameObject):
     def __init__(self, image, position, *groups):
         super().__init__(image, position, *groups)
 
+class FadeOverlay:
+    # one screen-sized surface in the fade colour shared by every Fade; a frame only changes its surface alpha
+    def __init__(self, color=COLOR_BG):
+        self.color = color
+        self.surface = None
+        self.alpha = None
+
+    def draw(self, target, alpha):
+        if alpha <= 0:
+            return
+        if alpha >= 255:
+            target.fill(self.color)
+            return
+        if self.surface is None or self.surface.get_size() != target.get_size():
+            self.surface = pygame.Surface(target.get_size()).convert()
+            self.surface.fill(self.color)
+            self.alpha = None
+        if alpha != self.alpha:
+            self.surface.set_alpha(alpha)
+            self.alpha = alpha
+        target.blit(self.surface, (0, 0))
+
+fade_overlay = FadeOverlay()
+
+class TransitionCompositor:
+    # cross-fades from the last frame of the old scene to one frame of the new one; both are snapshots
+    # taken once, so neither scene is drawn (or updated) until the blend is over
+    def __init__(self, duration=CROSSFADE_TIME):
+        self.duration = duration
+        self.scene = None
+        self.outgoing = None
+        self.incoming = None
+        self.elapsed = 0.0
+        self.active = False
+
+    def snapshot(self, surface, buffer):
+        if buffer is None or buffer.get_size() != surface.get_size():
+            buffer = pygame.Surface(surface.get_size()).convert()
+        buffer.blit(surface, (0, 0))
+        return buffer
+
+    def begin(self, scene, screen_surface, alpha):
+        surface = screen_surface.surface
+        self.outgoing = self.snapshot(surface, self.outgoing)
+        # the cross-fade replaces the scene's own fade-in
+        if hasattr(scene, 'fade'): scene.fade.skip()
+        scene.draw(screen_surface, alpha)
+        self.incoming = self.snapshot(surface, self.incoming)
+        self.elapsed = 0.0
+        self.active = True
+
+    def advance(self, dt):
+        self.elapsed += dt
+        if self.elapsed >= self.duration:
+            self.active = False
+
+    def draw(self, scene, screen_surface, alpha=1.0):
+        if scene is not self.scene:
+            previous, self.scene = self.scene, scene
+            if previous is not None and self.duration > 0:
+                self.begin(scene, screen_surface, alpha)
+        if not self.active:
+            return False
+        surface = screen_surface.surface
+        surface.blit(self.outgoing, (0, 0))
+        self.incoming.set_alpha(round(255 * min(self.elapsed / self.duration, 1)))
+        surface.blit(self.incoming, (0, 0))
+        return True
+
 class Fade:
+    layer = LAYER_OVERLAY
+
     def __init__(self, group):
         self.alpha = 255
         self.speed = 10
@@ -153,6 +785,10 @@ class Fade:
         self.on = True
         self.call_fade = True
 
+    def skip(self):
+        self.alpha = 0
+        self.call_fade = False
+
     def update(self):
         if self.call_fade:
             if self.on:
@@ -169,52 +805,470 @@ class Fade:
                     self.call_fade = False
 
     def draw(self):
-        if self.alpha > 0:
-            screen.draw.filled_rect(Rect(0, 0, WIDTH, HEIGHT), (COLOR_BG[0], COLOR_BG[1], COLOR_BG[2], self.alpha)) # type: ignore
+        fade_overlay.draw(screen.surface, self.alpha) # type: ignore
+
+class Coin(GameObject):
+    layer = LAYER_ANIMATED
 
-class Coin(Obj):
-    def __init__(self, img, pos, *group):
+    def __init__(self, img, pos, *group, store):
         super().__init__(img, pos, *group)
+        self.collected = False
+        store.add(self)
     
     def update(self):
-        self.image = self.animation('coin/', 5, 5)
-        return super().update()
+        self.store.update([self])
+
+class StaticLayer:
+    def __init__(self, background, page_size, max_pages=MAX_STATIC_PAGES):
+        self.background = background
+        self.page_size = page_size
+        self.grid = SpatialGrid()
+        self.max_pages = max_pages
+        self.pages = OrderedDict()
+        self.pattern = None
+        self.size = None
+
+    def invalidate(self):
+        self.pages.clear()
+        self.pattern = None
+
+    def add(self, sprites):
+        for sprite in sprites:
+            self.grid.insert(sprite)
+
+    def remove(self, sprites, page_x):
+        for sprite in sprites:
+            self.grid.remove(sprite)
+        for key in [key for key in self.pages if key[0] == page_x]:
+            del self.pages[key]
+
+    def bake_pattern(self, size):
+        run_steps(self.pattern_steps(size))
+
+    def pattern_steps(self, size):
+        pattern = pygame.Surface(size, 0, pygame.display.get_surface())
+        yield
+        pattern.fill(COLOR_BG)
+        for start in range(0, len(self.background), PRELOAD_BATCH):
+            pattern.blits([(sprite._surf, sprite.topleft) for sprite in self.background[start:start + PRELOAD_BATCH]], doreturn=False)
+            yield
+        self.pattern = pattern
+
+    def page(self, page_x, page_y):
+        return run_steps(self.bake_page(page_x, page_y))
+
+    def bake_page(self, page_x, page_y):
+        # paints the page one band of tile rows at a time, clipped, so the preloader can stop between bands
+        key = (page_x, page_y)
+        surface = self.pages.get(key)
+        if surface is not None:
+            self.pages.move_to_end(key)
+            return surface
+        width, height = self.page_size
+        left, top = page_x * width, page_y * height
+        surface = pygame.Surface(self.page_size, 0, self.pattern)
+        yield
+        pattern_width, pattern_height = self.pattern.get_size()
+        band_height = PAGE_BAND_ROWS * TILE_SIZE
+        for band_top in range(0, height, band_height):
+            band = Rect(0, band_top, width, min(band_height, height - band_top))
+            surface.set_clip(band)
+            for pattern_x in range(-(left % pattern_width), width, pattern_width):
+                for pattern_y in range(-(top % pattern_height), height, pattern_height):
+                    surface.blit(self.pattern, (pattern_x, pattern_y))
+            surface.blits([(sprite._surf, (sprite.left - left, sprite.top - top)) for sprite in self.grid.query(band.move(left, top))],
+                          doreturn=False)
+            yield
+        surface.set_clip(None)
+        self.pages[key] = surface
+        while len(self.pages) > self.max_pages:
+            self.pages.popitem(last=False)
+        return surface
+
+    def resize(self, size):
+        run_steps(self.resize_steps(size))
+
+    def resize_steps(self, size):
+        if size != self.size:
+            self.invalidate()
+            self.size = size
+        if self.pattern is None:
+            yield from self.pattern_steps(size)
+
+    def visible_pages(self, offset):
+        width, height = self.page_size
+        left, top = offset
+        return [(page_x, page_y)
+                for page_x in range(left // width, (left + self.size[0] - 1) // width + 1)
+                for page_y in range(top // height, (top + self.size[1] - 1) // height + 1)]
+
+    def draw(self, screen_surface, offset):
+        self.resize(screen_surface.surface.get_size())
+        width, height = self.page_size
+        for page_x, page_y in self.visible_pages(offset):
+            screen_surface.blit(self.page(page_x, page_y), (page_x * width - offset[0], page_y * height - offset[1]))
+
+class LevelChunk:
+    def __init__(self, index):
+        self.index = index
+        self.sprites = []
+        self.collisions = []
 
-class Particle:
-    def __init__(self, x, y):
-        self.x = x
-        self.y = y
-        self.size = random.randint(3, 6)
-        self.color = (random.randint(200, 255), random.randint(200, 255), random.randint(0, 255))
-        self.life = random.randint(40, 60)
-        self.velocity_x = random.uniform(-2, 2)
-        self.velocity_y = random.uniform(-2, 2)
-    
-    def update(self):
-        self.x += self.velocity_x
-        self.y += self.velocity_y
-        self.life -= 1
+class ChunkStreamer:
+    def __init__(self, scene, columns=CHUNK_COLUMNS, max_live=MAX_LIVE_CHUNKS):
+        self.scene = scene
+        self.columns = columns
+        self.max_live = max_live
+        self.chunk_width = columns * TILE_SIZE
+        total_columns = max((len(row_str) for row_str in scene.level), default=0)
+        self.chunk_count = max(1, math.ceil(total_columns / columns))
+        self.live = {}
+
+    def wanted(self, camera):
+        first = max(0, (camera.x - CHUNK_LOAD_MARGIN) // self.chunk_width)
+        last = min(self.chunk_count - 1, (camera.x + camera.width + CHUNK_LOAD_MARGIN) // self.chunk_width)
+        return range(first, last + 1)
+
+    def load(self, index):
+        run_steps(self.load_steps(index))
+
+    def load_steps(self, index):
+        if index not in self.live:
+            self.live[index] = yield from self.scene.chunk_steps(index, self.columns)
+
+    def update(self, camera):
+        wanted = self.wanted(camera)
+        for index in wanted:
+            self.load(index)
+        if len(self.live) > self.max_live:
+            center = (camera.x + camera.width // 2) // self.chunk_width
+            for index in sorted(self.live, key=lambda index: abs(index - center), reverse=True):
+                if len(self.live) <= self.max_live: break
+                if index in wanted: continue
+                self.scene.release_chunk(self.live.pop(index))
+
+class Camera:
+    def __init__(self, world_width, world_height, width=WIDTH, height=HEIGHT):
+        self.world_width = world_width
+        self.world_height = world_height
+        self.width = width
+        self.height = height
+        self.x = 0
+        self.y = 0
+        self.previous = None
+
+    @property
+    def offset(self):
+        return (self.x, self.y)
+
+    def snapshot(self):
+        self.previous = (self.x, self.y)
+
+    def interpolate(self, alpha=1.0):
+        if self.previous is None or alpha >= 1:
+            return self.offset
+        return (round(self.previous[0] + (self.x - self.previous[0]) * alpha),
+                round(self.previous[1] + (self.y - self.previous[1]) * alpha))
+
+    def resize(self, size):
+        self.width, self.height = size
+
+    def follow(self, target):
+        self.x = int(max(0, min(target.x - self.width // 2, self.world_width - self.width)))
+        self.y = int(max(0, min(target.y - self.height // 2, self.world_height - self.height)))
+
+    def viewport(self, margin=0):
+        return Rect(self.x - margin, self.y - margin, self.width + 2 * margin, self.height + 2 * margin)
+
+class FixedStepLoop:
+    def __init__(self, step, tick_rate=TICK_RATE, max_substeps=MAX_SUBSTEPS):
+        self.step = step
+        self.dt = 1 / tick_rate
+        self.max_substeps = max_substeps
+        self.accumulator = 0.0
+        self.alpha = 1.0
+        self.ticks = 0
+        self.dropped = 0
+
+    def advance(self, elapsed):
+        self.accumulator += elapsed
+        steps = 0
+        while self.accumulator >= self.dt:
+            if steps == self.max_substeps:
+                # too far behind to catch up: drop the backlog instead of spiralling
+                self.dropped += int(self.accumulator // self.dt)
+                self.accumulator %= self.dt
+                break
+            self.step()
+            self.accumulator -= self.dt
+            self.ticks += 1
+            steps += 1
+        self.alpha = self.accumulator / self.dt
+        return steps
+
+def merge_rects(rects):
+    merged = []
+    for rect in rects:
+        rect = rect.copy()
+        index = rect.collidelist(merged)
+        while index != -1:
+            rect.union_ip(merged.pop(index))
+            index = rect.collidelist(merged)
+        merged.append(rect)
+    return merged
+
+class DirtyRenderer:
+    # redraws only where something changed: scenes list (key, screen rect, token) for every element that can
+    # change, a key whose rect or token differs from last frame dirties both rects, and each merged region is
+    # redrawn by the scene's normal draw clipped to it, so the pixels match a full redraw
+    def __init__(self, max_rects=MAX_DIRTY_RECTS, full_ratio=DIRTY_FULL_RATIO):
+        self.max_rects = max_rects
+        self.full_ratio = full_ratio
+        self.enabled = False
+        self.flip = pygame.display.flip
+        self.scene = None
+        self.size = None
+        self.items = {}
+        self.rects = []
+        self.full = True
+        self.forced = True
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        self.scene = None
+        # pgzero flips the whole window after every draw(); while enabled that flip presents just the dirty rects
+        pygame.display.flip = self.present if enabled else self.flip
+
+    def dirty_rects(self, items):
+        rects = []
+        current = {}
+        for key, (x, y, width, height), token in items:
+            rect = pygame.Rect(math.floor(x) - 1, math.floor(y) - 1, math.ceil(width) + 3, math.ceil(height) + 3)
+            current[key] = (rect, token)
+            previous = self.items.get(key)
+            if previous is None:
+                rects.append(rect)
+            elif previous[0] != rect or previous[1] != token:
+                rects.append(previous[0])
+                rects.append(rect)
+        rects.extend(previous[0] for key, previous in self.items.items() if key not in current)
+        self.items = current
+        return merge_rects(rects)
+
+    def draw(self, scene, screen_surface, alpha=1.0, full=False):
+        surface = screen_surface.surface
+        size = surface.get_size()
+        items = scene.dirty_items(alpha) if self.enabled else None
+        bounds = surface.get_rect()
+        self.rects = [rect.clip(bounds) for rect in self.dirty_rects(items or []) if rect.colliderect(bounds)]
+        area = sum(rect.width * rect.height for rect in self.rects)
+        # whatever forced a full frame (a fade, the profiler overlay) isn't tracked, so the frame after it is full too
+        forced = items is None or full
+        self.full = (forced or self.forced or scene is not self.scene or size != self.size or
+                     len(self.rects) > self.max_rects or area > self.full_ratio * size[0] * size[1])
+        self.scene, self.size, self.forced = scene, size, forced
+        if self.full:
+            self.rects = [surface.get_rect()]
+            scene.draw(screen_surface, alpha)
+            return
+        for rect in self.rects:
+            surface.set_clip(rect)
+            scene.draw(screen_surface, alpha)
+        surface.set_clip(None)
+
+    def invalidate(self):
+        # something else drew the whole frame: present all of it and start the next draw from scratch
+        self.full = self.forced = True
+        self.scene = None
+
+    def present(self):
+        if self.full: self.flip()
+        elif self.rects: pygame.display.update(self.rects)
+
+class ProfileSection:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.start, time.perf_counter() - self.start)
+
+class Profiler:
+    def __init__(self, capacity=PROFILE_FRAMES):
+        self.frames = deque(maxlen=capacity)
+        self.events = deque(maxlen=capacity * 32)
+        self.sections = {}
+        self.current = {}
+        self.frame_start = None
+        self.visible = False
+
+    def section(self, name):
+        return ProfileSection(self, name)
+
+    def record(self, name, start, duration):
+        self.sections.setdefault(name, len(self.sections))
+        self.current[name] = self.current.get(name, 0.0) + duration
+        self.events.append((name, start, duration))
+
+    def begin_frame(self):
+        if self.frame_start is not None:
+            self.end_frame()
+        self.frame_start = time.perf_counter()
+        self.current = {}
+
+    def end_frame(self):
+        if self.frame_start is None:
+            return
+        self.frames.append((self.frame_start, time.perf_counter() - self.frame_start, self.current))
+        self.frame_start = None
+
+    def fps(self):
+        if len(self.frames) < 2:
+            return 0.0
+        elapsed = self.frames[-1][0] - self.frames[0][0]
+        return (len(self.frames) - 1) / elapsed if elapsed > 0 else 0.0
+
+    def averages(self, frames=60):
+        recent = list(self.frames)[-frames:]
+        totals = dict.fromkeys(self.sections, 0.0)
+        for _, _, sections in recent:
+            for name, seconds in sections.items():
+                totals[name] += seconds
+        return {name: 1000 * seconds / max(1, len(recent)) for name, seconds in totals.items()}
+
+    def draw(self, screen_surface, counts=None):
+        if not self.visible:
+            return
+        lines = [f"{self.fps():5.1f} fps"]
+        lines += [f"{name:<12}{ms:7.3f} ms" for name, ms in self.averages().items()]
+        lines += [f"{name:<12}{count:7d}" for name, count in (counts or {}).items()]
+        screen_surface.draw.text("\n".join(lines), topright=(screen_surface.surface.get_width() - 10, 10),
+                                 fontsize=24, color="white", ocolor="black", owidth=1)
+
+    def dump_csv(self, path):
+        names = list(self.sections)
+        with open(path, 'w', newline='') as output:
+            writer = csv.writer(output)
+            writer.writerow(['frame', 'frame_ms'] + [f'{name}_ms' for name in names])
+            for index, (_, duration, sections) in enumerate(self.frames):
+                writer.writerow([index, round(1000 * duration, 4)] + [round(1000 * sections.get(name, 0.0), 4) for name in names])
+
+    def dump_trace(self, path):
+        origin = self.events[0][1] if self.events else 0.0
+        events = [{'name': name, 'ph': 'X', 'pid': 0, 'tid': 0,
+                   'ts': round((start - origin) * 1e6, 1), 'dur': round(duration * 1e6, 1)}
+                  for name, start, duration in self.events]
+        events += [{'name': 'frame', 'ph': 'X', 'pid': 0, 'tid': 1,
+                    'ts': round((start - origin) * 1e6, 1), 'dur': round(duration * 1e6, 1)}
+                   for start, duration, _ in self.frames if start >= origin]
+        with open(path, 'w') as output:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, output)
+
+    def dump(self, path):
+        if path.endswith('.csv'):
+            self.dump_csv(path)
+        else:
+            self.dump_trace(path)
+
+profiler = Profiler()
+
+class ParticleSystem:
+    def __init__(self, capacity=MAX_PARTICLES, seed=None):
+        self.capacity = capacity
+        self.position = np.zeros((capacity, 2))
+        self.velocity = np.zeros((capacity, 2))
+        self.life = np.zeros(capacity, dtype=np.int32)
+        self.size = np.zeros(capacity, dtype=np.int32)
+        self.color = np.zeros((capacity, 3), dtype=np.int32)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.born = np.zeros(capacity, dtype=np.int64)
+        self.emitted = 0
+        self.free = np.arange(capacity - 1, -1, -1)
+        self.free_count = capacity
+        self.rng = np.random.default_rng(seed)
+        self.version = 0
+
+    def __len__(self):
+        return self.capacity - self.free_count
+
+    def emit(self, x, y, count=10):
+        count = min(count, self.free_count)
+        if count <= 0:
+            return
+        slots = self.free[self.free_count - count:self.free_count]
+        self.free_count -= count
+        self.position[slots] = (x, y)
+        self.velocity[slots] = self.rng.uniform(-2, 2, (count, 2))
+        self.size[slots] = self.rng.integers(3, 7, count)
+        self.color[slots, :2] = self.rng.integers(200, 256, (count, 2))
+        self.color[slots, 2] = self.rng.integers(0, 256, count)
+        self.life[slots] = self.rng.integers(40, 61, count)
+        self.alive[slots] = True
+        self.born[slots] = np.arange(self.emitted, self.emitted + count)
+        self.emitted += count
 
-    def draw(self):
-        screen.draw.filled_circle((self.x, self.y), self.size, self.color) # type: ignore
+    def update(self):
+        if self.free_count == self.capacity:
+            return
+        self.version += 1
+        np.add(self.position, self.velocity, out=self.position, where=self.alive[:, None])
+        np.subtract(self.life, 1, out=self.life, where=self.alive)
+        dead = np.flatnonzero(self.alive & (self.life <= 0))
+        if len(dead):
+            self.alive[dead] = False
+            self.free[self.free_count:self.free_count + len(dead)] = dead
+            self.free_count += len(dead)
+
+    def bounds(self):
+        if self.free_count == self.capacity:
+            return None
+        indices = np.flatnonzero(self.alive)
+        reach = int(self.size[indices].max()) + 1
+        left, top = np.floor(self.position[indices].min(axis=0)).tolist()
+        right, bottom = np.ceil(self.position[indices].max(axis=0)).tolist()
+        return (left - reach, top - reach, right - left + 2 * reach, bottom - top + 2 * reach)
+
+    def draw(self, screen_surface, offset=(0, 0)):
+        if self.free_count == self.capacity:
+            return
+        surface = screen_surface.surface
+        # freed slots get reused, so sort by emission to paint overlapping particles oldest first
+        indices = np.flatnonzero(self.alive)
+        indices = indices[np.argsort(self.born[indices], kind='stable')]
+        points = np.rint(self.position[indices] - offset).astype(np.int64).tolist()
+        for point, size, color in zip(points, self.size[indices].tolist(), self.color[indices].tolist()):
+            pygame.draw.circle(surface, color, point, size)
 
 class Player(Obj):
+    layer = LAYER_DYNAMIC
+
     def __init__(self, img, pos, collisions, group):
         super().__init__(img, pos, group)
         self.life = 3
+        self.respawns = 0
         self.start_position = (0, 0)
         self.speed = 5
         self.jump_speed = -18
         self.gravity = 1
+        self.max_fall_speed = 10
         self.direction = Vector2(0, 0)
         self.collisions = collisions
+        self.collision_grid = None
+        self.world_width = WIDTH
+        self.world_height = HEIGHT
+        self.controls = keyboard # type: ignore
         self.image = 'player/base/base'
+        self.base_surface = assets.get('player/base/base')
         self.collision_area = Rect(self.x, self.y, 40, 40)
         self.on_ground = False
         self.can_dash = False
         self.dash_speed = 4
         self.dash_timer = 1
         self.dash_duration = 1
+        self.dash_ticks = 10
         self.n_dash = 3
         self.time_dash = 0
         self.flip = False
@@ -230,17 +1284,25 @@ class Player(Obj):
         }
         self.control_animation = self.animations[State.IDLE]
         self.current_animation = State.IDLE
+        self.overlay_surface = self.control_animation.frames[0]
             
     def return_to_start(self):
         self.x, self.y = self.start_position
-        if sound_enabled: sounds.death.play() # type: ignore
+        self.previous = None
+        self.respawns += 1
+        audio.play('death')
 
     def drop_platform(self):
-        if self.y > HEIGHT + 200:
+        if self.y > self.world_height + 200:
             self.return_to_start()
 
+    def nearby_collisions(self):
+        if self.collision_grid is None:
+            return self.collisions
+        return self.collision_grid.query(self, COLLISION_MARGIN)
+
     def y_collision_check(self):
-        for sprite in self.collisions:
+        for sprite in self.nearby_collisions():
             if sprite.name == "platform":
                 if sprite.colliderect(self):
                     if self.direction.y > 0:
@@ -252,7 +1314,7 @@ class Player(Obj):
                         self.top = sprite.bottom
     
     def x_collision_check(self):
-        for sprite in self.collisions:
+        for sprite in self.nearby_collisions():
             if sprite.name == "platform":
                 if sprite.colliderect(self):
                     if self.direction.x > 0:
@@ -262,7 +1324,7 @@ class Player(Obj):
     
     def gravity_force(self):
         if not self.can_dash:
-            if self.direction.y < 10:
+            if self.direction.y < self.max_fall_speed:
                 self.direction.y += self.gravity
             self.y += self.direction.y
     
@@ -284,26 +1346,26 @@ class Player(Obj):
                 self.direction.x = 0
             
     def limit_to_screen(self):
-        self.x = max(64, min(self.x, 1216)) 
+        self.x = max(64, min(self.x, self.world_width - 64))
                 
     def events(self):
         if not self.can_dash:
-            if keyboard.left: # type: ignore
+            if self.controls.left:
                 self.direction.x = -1
                 self.flip = True
-            elif keyboard.right: # type: ignore
+            elif self.controls.right:
                 self.direction.x = 1
                 self.flip = False
             else:
                 self.direction.x = 0
-            if keyboard.z and self.on_ground: # type: ignore
+            if self.controls.z and self.on_ground:
                 self.on_ground = False
                 self.direction.y = self.jump_speed
-                if sound_enabled: sounds.jump.play() # type: ignore
-            if keyboard.x and not self.on_ground and self.n_dash > 0: # type: ignore
+                audio.play('jump')
+            if self.controls.x and not self.on_ground and self.n_dash > 0:
                 self.can_dash = True
                 self.n_dash -=1
-                if sound_enabled: sounds.dash.play() # type: ignore
+                audio.play('dash')
                 if self.flip: self.direction.x = -self.dash_speed 
                 else: self.direction.x = self.dash_speed
                 self.direction.y = 0 
@@ -321,10 +1383,11 @@ class Player(Obj):
         if self.control_animation != self.animations[self.current_animation]:
             self.control_animation = self.animations[self.current_animation]
 
-    def draw(self):
-        overlay_image = self.control_animation.animation()
-        screen.blit('player/base/base', (self.x - 20, self.y - 20)) # type: ignore
-        screen.blit(overlay_image, (self.x - 30, self.y - 20)) # type: ignore
+    def draw(self, offset=(0, 0), alpha=1.0):
+        dx, dy = self.interpolation(alpha)
+        x, y = self.x + dx - offset[0], self.y + dy - offset[1]
+        screen.blit(self.base_surface, (x - 20, y - 20)) # type: ignore
+        screen.blit(self.overlay_surface, (x - 30, y - 20)) # type: ignore
 
     def update(self):
         self.events()
@@ -333,9 +1396,10 @@ class Player(Obj):
         self.gravity_force()
         self.y_collision_check()
         self.animation_stage()
-        self.reset_dash()
+        self.reset_dash(self.dash_ticks)
         self.drop_platform()
         self.limit_to_screen()
+        self.overlay_surface = self.control_animation.animation()
 
 BG_MAP = [  
     "S",  
@@ -418,6 +1482,186 @@ MAP4 = [
 '  P   X     X       ',
 'XXXXXSSSSSSSSSSSSSXX']
 
+# the text maps are the source of levels/stageN.lvl; tests/test_levels.py keeps the two in step
+BUILTIN_MAPS = [MAP0, MAP1, MAP2, MAP3, MAP4]
+
+def compile_level(map_data):
+    width = max((len(row_str) for row_str in map_data), default=0)
+    height = len(map_data)
+    tiles = bytearray(width * height)
+    entities = []
+    for row_idx, row_str in enumerate(map_data):
+        for col_idx, tile_char in enumerate(row_str):
+            if tile_char in LEVEL_ENTITIES:
+                entities.append(LEVEL_ENTITY.pack(tile_char.encode('ascii'), col_idx, row_idx))
+            elif tile_char in LEVEL_TILES:
+                tiles[row_idx * width + col_idx] = LEVEL_TILES.index(tile_char)
+            else:
+                raise ValueError(f"unknown tile {tile_char!r} at row {row_idx}, column {col_idx}")
+    return LEVEL_HEADER.pack(LEVEL_MAGIC, LEVEL_VERSION, width, height, len(entities)) + bytes(tiles) + b''.join(entities)
+
+class Level:
+    DECODE = bytes.maketrans(bytes(range(len(LEVEL_TILES))), LEVEL_TILES.encode('ascii'))
+
+    def __init__(self, buffer, name=None):
+        magic, version, self.width, self.height, entity_count = LEVEL_HEADER.unpack_from(buffer, 0)
+        if magic != LEVEL_MAGIC or version != LEVEL_VERSION:
+            raise ValueError(f"{name or 'level'} is not a version {LEVEL_VERSION} level file")
+        self.name = name
+        self.buffer = buffer
+        self.tiles_offset = LEVEL_HEADER.size
+        entities_offset = self.tiles_offset + self.width * self.height
+        self.entities = {}
+        for index in range(entity_count):
+            kind, col_idx, row_idx = LEVEL_ENTITY.unpack_from(buffer, entities_offset + index * LEVEL_ENTITY.size)
+            self.entities.setdefault(row_idx, []).append((col_idx, kind.decode('ascii')))
+        self.rows = {}
+
+    def __len__(self):
+        return self.height
+
+    def __iter__(self):
+        for row_idx in range(self.height):
+            yield self[row_idx]
+
+    def __getitem__(self, row_idx):
+        if row_idx < 0: row_idx += self.height
+        if not 0 <= row_idx < self.height:
+            raise IndexError('level row out of range')
+        row_str = self.rows.get(row_idx)
+        if row_str is None:
+            start = self.tiles_offset + row_idx * self.width
+            row_str = self.buffer[start:start + self.width].translate(self.DECODE).decode('ascii')
+            if row_idx in self.entities:
+                row_chars = list(row_str)
+                for col_idx, kind in self.entities[row_idx]:
+                    row_chars[col_idx] = kind
+                row_str = ''.join(row_chars)
+            self.rows[row_idx] = row_str
+        return row_str
+
+def load_level(path):
+    with open(path, 'rb') as level_file:
+        buffer = mmap.mmap(level_file.fileno(), 0, access=mmap.ACCESS_READ)
+    return Level(buffer, os.path.basename(path))
+
+def stage_number(path):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return int(name[len('stage'):]) if name[len('stage'):].isdigit() else -1
+
+def load_world(level_dir=LEVEL_DIR):
+    if os.path.isdir(level_dir):
+        paths = [os.path.join(level_dir, name) for name in os.listdir(level_dir) if name.endswith('.lvl')]
+        paths = sorted((path for path in paths if stage_number(path) >= 0), key=stage_number)
+        if paths:
+            return [load_level(path) for path in paths]
+    print(f"no stageN.lvl files in {level_dir}, playing the built-in maps (run python levelc.py)")
+    return list(BUILTIN_MAPS)
+
+WORLD_MAP = load_world()
+
+def read_buttons(controls):
+    return sum(bit for name, bit in BUTTON_BITS.items() if getattr(controls, name))
+
+class ButtonState:
+    # stands in for pgzero's keyboard wherever the buttons come from a replay, a script or a policy
+    def __init__(self):
+        self.left = self.right = self.z = self.x = False
+
+    def set(self, buttons):
+        for name, bit in BUTTON_BITS.items():
+            setattr(self, name, bool(buttons & bit))
+
+def state_checksum(scene):
+    player = scene.player
+    state = REPLAY_STATE.pack(player.x, player.y, player.life, player.n_dash, scene.world.stage, scene.coins_remaining())
+    return zlib.crc32(state)
+
+class Replay:
+    def __init__(self, stage=0, seed=0, interval=REPLAY_CHECKSUM_INTERVAL):
+        self.stage = stage
+        self.seed = seed
+        self.interval = interval
+        self.inputs = bytearray()
+        self.checksums = []
+
+    def __len__(self):
+        return len(self.inputs)
+
+    def record(self, buttons, scene):
+        self.inputs.append(buttons)
+        if len(self.inputs) % self.interval == 0:
+            self.checksums.append(state_checksum(scene))
+
+    def expected(self, frame):
+        if (frame + 1) % self.interval:
+            return None
+        index = (frame + 1) // self.interval - 1
+        return self.checksums[index] if index < len(self.checksums) else None
+
+    def save(self, path):
+        payload = bytes(self.inputs) + struct.pack(f'<{len(self.checksums)}I', *self.checksums)
+        with open(path, 'wb') as replay_file:
+            replay_file.write(REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, self.stage, self.seed, self.interval, len(self.inputs)))
+            replay_file.write(zlib.compress(payload, 9))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as replay_file:
+            data = replay_file.read()
+        magic, version, stage, seed, interval, frames = REPLAY_HEADER.unpack_from(data, 0)
+        if magic != REPLAY_MAGIC or version != REPLAY_VERSION:
+            raise ValueError(f"{path} is not a version {REPLAY_VERSION} replay file")
+        payload = zlib.decompress(data[REPLAY_HEADER.size:])
+        replay = cls(stage, seed, interval)
+        replay.inputs = bytearray(payload[:frames])
+        replay.checksums = list(struct.unpack_from(f'<{frames // interval}I', payload, frames))
+        return replay
+
+class ReplaySession:
+    def __init__(self, replay, playback=False, path=None):
+        self.replay = replay
+        self.playback = playback
+        self.path = path
+        self.controls = ButtonState()
+        self.frame = 0
+        self.buttons = 0
+        self.desync = None
+
+    @property
+    def finished(self):
+        return self.playback and self.frame >= len(self.replay)
+
+    def start(self, world):
+        world.random.seed(self.replay.seed)
+        world.stage = self.replay.stage
+        return GameScene(world)
+
+    def before_tick(self, scene):
+        if not isinstance(scene, GameScene) or self.finished:
+            return
+        if self.playback:
+            self.controls.set(self.replay.inputs[self.frame])
+            scene.player.controls = self.controls
+        else:
+            self.buttons = read_buttons(scene.player.controls)
+
+    def after_tick(self, scene):
+        if not isinstance(scene, GameScene) or self.finished:
+            return
+        if self.playback:
+            expected = self.replay.expected(self.frame)
+            if expected is not None and self.desync is None:
+                actual = state_checksum(scene)
+                if actual != expected:
+                    self.desync = (self.frame, expected, actual)
+                    print(f"replay desync at frame {self.frame}: expected {expected:08x}, got {actual:08x} "
+                          f"(x={scene.player.x}, y={scene.player.y}, life={scene.player.life}, "
+                          f"n_dash={scene.player.n_dash}, stage={scene.world.stage}, coins={scene.coins_remaining()})")
+        else:
+            self.replay.record(self.buttons, scene)
+        self.frame += 1
+
 TEXT_INTRO = """Disclaimer: Tirei os acentos, porque estavam bugados. 
 Num despertar envolto em nevoas prateadas, o guerreiro abriu os olhos sob um dossel vivo de folhas entrelacadas que sussurravam historias.
 Seu coracao bateu com estranha curiosidade,
@@ -430,35 +1674,52 @@ GAMEOVER_TEXT = """GAME OVER! Suas forças falharam e as sombras venceram.
 O veu das eras se fecha em torno de você.
 FIM DE JOGO."""
 
+class StagePreloader:
+    def __init__(self, world, budget=PRELOAD_BUDGET):
+        self.world = world
+        self.budget = budget
+        self.stage = None
+        self.scene = None
+
+    def request(self, stage):
+        if stage == self.stage or stage >= len(self.world.world_map):
+            return
+        self.stage = stage
+        self.scene = GameScene(self.world, self.world.world_map[stage], preload=True)
+
+    def idle(self):
+        if self.scene is None or self.scene.loading is None:
+            return
+        deadline = time.perf_counter() + self.budget
+        while self.scene.loading is not None and time.perf_counter() < deadline:
+            self.scene.load_step()
+
+    def take(self, stage):
+        if stage != self.stage:
+            return None
+        scene = self.scene
+        self.stage = self.scene = None
+        scene.finish_loading()
+        scene.seed_particles()
+        return scene
+
 class Scene:
-    def __init__(self):
+    def __init__(self, world):
+        self.world = world
         self.new = self
-        self.all_sprites = []
+        self.all_sprites = SpriteGroup()
         self.collisions = []
-        self.particles = []
-        self.world_map = [MAP0, MAP1, MAP2, MAP3, MAP4] 
-
-    def start_music(self, lib, music_name):
-        global sound_enabled
-        try:
-            music.play(music_name)
-            if sound_enabled:
-                music.set_volume(1.0)
-            else:
-                music.set_volume(0)
-        except Exception as e:
-            print(f"'{music_name}': {e}")
-            pass
+        self.world_map = world.world_map
+        self.level = None
+        self.collected_coins = set()
 
-
-    def create_particles(self, x, y):
-        for _ in range(10):
-            self.particles.append(Particle(x, y))
-    
-    def draw(self, screen_surface):
+    def draw(self, screen_surface, alpha=1.0):
         pass
 
     def generate_bg(self, all_sprites_list):
+        run_steps(self.bg_steps(all_sprites_list))
+
+    def bg_steps(self, all_sprites_list):
         background_tile_image_paths = {
             'S': 'tiles/background_solid_sky.png',
             'C': 'tiles/background_clouds.png',
@@ -499,17 +1760,20 @@ class Scene:
                         break
                     Obj(tile_image_to_use, (x_pixel_for_tile, y_pixel_for_tile_row), all_sprites_list)
                 y_pixel_for_tile_row += TILE_SIZE 
+                yield
             current_band_start_y_pixel = band_end_y_pixel 
 
-    def generate_map(self, all_sprites_list, collision_list, player_actor):
-        global n_stage
-        current_map_data = self.world_map[n_stage]
+    def generate_map(self, all_sprites_list, collision_list, player_actor, first_col=0, last_col=None):
+        run_steps(self.map_steps(all_sprites_list, collision_list, player_actor, first_col, last_col))
+
+    def map_steps(self, all_sprites_list, collision_list, player_actor, first_col=0, last_col=None):
+        current_map_data = self.level if self.level is not None else self.world_map[self.world.stage]
         default_platform_for_x = 'tiles/terrain_grass_block_center' 
         o2_sprite_width = 64 
         o2_sprite_height = 32 
 
         for row_idx, row_str in enumerate(current_map_data):
-            for col_idx, tile_char in enumerate(row_str):
+            for col_idx, tile_char in enumerate(row_str[first_col:last_col], first_col):
                 x = col_idx * TILE_SIZE
                 y = row_idx * TILE_SIZE
                 image_to_load, is_platform, obj_name, object_instance = None, False, None, None
@@ -523,16 +1787,19 @@ class Scene:
                 elif tile_char == "X": image_to_load, is_platform = default_platform_for_x, True 
                 elif tile_char == "C": image_to_load, obj_name = 'tiles/4', "next" 
                 elif tile_char == "O": 
-                    object_instance = Bee('dummy_image_for_bee', (x, y), all_sprites_list, collision_list)
+                    object_instance = Bee('obstacles/bee_rest', (x, y), all_sprites_list, collision_list, store=self.bees)
                     if object_instance: object_instance.name = "obstacle"
                 elif tile_char == "S": 
                     image_to_load, obj_name = 'obstacles/o2', "obstacle" 
                 elif tile_char == "A": 
+                    if (col_idx, row_idx) in self.collected_coins: continue
                     coin_width, coin_height = 32, 32 
-                    object_instance = Coin('coin/0', (x + (TILE_SIZE - coin_width)//2, y + (TILE_SIZE - coin_height)//2), all_sprites_list, collision_list) 
-                    if object_instance: object_instance.name = "coin"
+                    object_instance = Coin('coin/0', (x + (TILE_SIZE - coin_width)//2, y + (TILE_SIZE - coin_height)//2), all_sprites_list, collision_list, store=self.coins) 
+                    if object_instance: 
+                        object_instance.name = "coin"
+                        object_instance.tile = (col_idx, row_idx)
                 elif tile_char == "0": image_to_load, obj_name = 'tiles/4', "theend" 
-                elif tile_char == "P": 
+                elif tile_char == "P" and player_actor is not None: 
                     player_actor.x, player_actor.y = x, y
                     player_actor.start_position = (x, y)
 
@@ -543,19 +1810,36 @@ class Scene:
                         current_pos_x = x + (TILE_SIZE - o2_sprite_width) // 2
                         current_pos_y = y + (TILE_SIZE - o2_sprite_height) 
                         current_pos = (current_pos_x, current_pos_y)
-                    new_obj = Obj(image_to_load, current_pos, all_sprites_list, collision_list)
-                    if is_platform: new_obj.name = "platform"
-                    elif obj_name: new_obj.name = obj_name
+                    if is_platform:
+                        new_obj = Obj(image_to_load, current_pos, all_sprites_list)
+                        new_obj.name = "platform"
+                    else:
+                        new_obj = Obj(image_to_load, current_pos, all_sprites_list, collision_list)
+                        if obj_name: new_obj.name = obj_name
+            yield
+
+        collision_list.extend(merge_solid_tiles(current_map_data, first_col, last_col))
             
     def on_mouse_down(self, pos): pass
     def on_key_down(self, key): pass
     def update(self): pass
+    def counts(self): return {'sprites': len(self.all_sprites)}
+
+    def dirty_items(self, alpha=1.0):
+        # None means redraw everything; scenes that know what changes list it for DirtyRenderer
+        return None
+
+    def sprite_items(self, sprites):
+        if self.fade.alpha > 0:
+            return None
+        return [(id(sprite), (sprite.left, sprite.top) + sprite._surf.get_size(), sprite._surf)
+                for sprite in sprites if isinstance(sprite, GameObject)]
+
     def change_scene(self, new_scene): self.new = new_scene
     
 class MenuScene(Scene):
-    def __init__(self):
-        super().__init__()
-        self.all_sprites = [] 
+    def __init__(self, world):
+        super().__init__(world)
         self.menu_itens = {
             'bg1': BgAnimated('menu/bg', 360), 
             'bg2': BgAnimated('menu/bg', -360), 
@@ -566,41 +1850,41 @@ class MenuScene(Scene):
         }
         self.fade = Fade(self.all_sprites)
         self.fade.fadein()
-        self.start_music(music, 'menu') # type: ignore
+        audio.play_music('menu')
 
-    def draw(self, screen_surface): 
+    def draw(self, screen_surface, alpha=1.0):
         self.menu_itens['bg1'].draw()
         self.menu_itens['bg2'].draw()
-        for sprite in self.all_sprites:
-            sprite.draw()
+        self.all_sprites.draw(screen_surface.surface)
+
+    def dirty_items(self, alpha=1.0):
+        # the backgrounds cover the screen and scroll every frame, so this always ends up a full redraw
+        items = self.sprite_items(self.all_sprites)
+        if items is None:
+            return None
+        return items + [(name, (0, self.menu_itens[name].y) + self.menu_itens[name]._surf.get_size(), None) for name in ('bg1', 'bg2')]
             
     def on_key_down(self, key):
         if key == keys.ESCAPE: quit() # type: ignore
-        if key == keys.RETURN: self.change_scene(Intro()) # type: ignore
+        if key == keys.RETURN: self.change_scene(Intro(self.world)) # type: ignore
 
     def on_mouse_down(self, pos):
-        global sound_enabled
         if self.menu_itens['button_play'].collidepoint(pos):
-            self.change_scene(Intro())
+            self.change_scene(Intro(self.world))
         elif self.menu_itens['button_exit'].collidepoint(pos):
             quit()
         elif self.menu_itens['button_sound'].collidepoint(pos):
-            sound_enabled = not sound_enabled
-            if sound_enabled:
-                music.set_volume(1.0) 
-            else:
-                music.set_volume(0)
+            audio.set_enabled(not audio.enabled)
 
     def update(self):
+        self.world.preloader.request(self.world.stage)
         self.menu_itens['bg1'].update(speed=1, limit=1080, start_position=360)
         self.menu_itens['bg2'].update(1, 360, -360)
-        for sprite in self.all_sprites:
-            sprite.update()
+        self.all_sprites.update()
 
 class Intro(Scene):
-    def __init__(self):
-        super().__init__()
-        self.all_sprites = []
+    def __init__(self, world):
+        super().__init__(world)
         self.comands = Obj('menu/comands', (45, 550), self.all_sprites)
         self.button = Button('menu/text_play', (WIDTH - 120, HEIGHT - 100), self.all_sprites)
         self.fade = Fade(self.all_sprites)
@@ -609,136 +1893,383 @@ class Intro(Scene):
     def on_key_down(self, key):
         if key == keys.ESCAPE: quit() # type: ignore
         if key == keys.RETURN: # type: ignore
-            self.start_music(music, 'game') # type: ignore
-            self.change_scene(GameScene())
+            audio.play_music('game')
+            self.change_scene(self.world.preloader.take(self.world.stage) or GameScene(self.world))
 
     def on_mouse_down(self, pos):
         if self.button.collidepoint(pos):
-            self.start_music(music, 'game') # type: ignore
-            self.change_scene(GameScene())
+            audio.play_music('game')
+            self.change_scene(self.world.preloader.take(self.world.stage) or GameScene(self.world))
 
-    def draw(self, screen_surface):
+    def draw(self, screen_surface, alpha=1.0):
         screen_surface.fill(COLOR_BG)
-        screen_surface.draw.text(TEXT_INTRO, (100, 100), color="white", fontsize=24) 
-        for sprite in self.all_sprites:
-            sprite.draw()
+        text_cache.draw(screen_surface, TEXT_INTRO, (100, 100), color="white", fontsize=24) 
+        self.all_sprites.draw(screen_surface.surface)
+
+    def dirty_items(self, alpha=1.0):
+        return self.sprite_items(self.all_sprites)
     
     def update(self):
-        for sprite in self.all_sprites: sprite.update()
+        self.world.preloader.request(self.world.stage)
+        self.all_sprites.update()
             
 class GameScene(Scene):
-    def __init__(self):
-        super().__init__()
-        self.all_sprites = [] 
+    def __init__(self, world, level=None, preload=False):
+        super().__init__(world)
+        self.particles = ParticleSystem()
+        if not preload: self.seed_particles()
+        self.bees = BeeStore(**world.bee_params)
+        self.coins = CoinStore()
+        self.level = level if level is not None else self.world_map[world.stage]
+        self.loading = self.build()
+        if not preload:
+            self.finish_loading()
+
+    def load_step(self):
+        try:
+            next(self.loading)
+        except StopIteration:
+            self.loading = None
+
+    def finish_loading(self):
+        while self.loading is not None:
+            self.load_step()
+
+    def build(self):
+        # yields after every tile row, sprite batch and page band so each preloader step fits in its budget
+        self.coin_total = sum(row_str.count('A') for row_str in self.level)
+        yield
+        self.all_sprites = SpriteGroup()
         self.all_collisions = [] 
-        self.generate_bg(self.all_sprites) 
+        self.background = []
+        yield from self.bg_steps(self.background) 
         self.player = Player('player/idle/0', (100, 0), self.all_collisions, self.all_sprites) 
-        self.generate_map(self.all_sprites, self.all_collisions, self.player)
+        for name, value in self.world.player_params.items(): setattr(self.player, name, value)
+        start_position = find_start(self.level)
+        if start_position:
+            self.player.x, self.player.y = start_position
+            self.player.start_position = start_position
+        self.grid = SpatialGrid()
+        self.sprite_grid = SpatialGrid()
+        self.player.collision_grid = self.grid
+        self.trigger_handlers = {
+            "next": self.on_next,
+            "obstacle": self.on_obstacle,
+            "theend": self.on_theend,
+            "coin": self.on_coin,
+        }
+        self.triggers = TriggerIndex(self.trigger_handlers)
+        self.world_width, self.world_height = level_size(self.level)
+        self.player.world_width, self.player.world_height = self.world_width, self.world_height
+        self.camera = Camera(self.world_width, self.world_height)
+        self.camera.follow(self.player)
+        self.static_layer = StaticLayer(self.background, (CHUNK_COLUMNS * TILE_SIZE, PAGE_ROWS * TILE_SIZE))
+        self.chunks = ChunkStreamer(self)
+        yield
+        for index in self.chunks.wanted(self.camera):
+            yield from self.chunks.load_steps(index)
+        self.chunks.update(self.camera)
+        yield from self.static_layer.resize_steps((self.camera.width, self.camera.height))
+        for page_x, page_y in self.static_layer.visible_pages(self.camera.offset):
+            yield
+            yield from self.static_layer.bake_page(page_x, page_y)
         self.fade = Fade(self.all_sprites)
         self.fade.fadein()
+        self.hud_state = None
+        self.hud = []
+
+    def seed_particles(self):
+        self.particles.rng = np.random.default_rng(self.world.random.getrandbits(32))
 
-    def draw(self, screen_surface):
-        screen_surface.fill(COLOR_BG) 
-        for sprite in self.all_sprites: 
-            sprite.draw()
-        for particle in self.particles:
-            particle.draw()
-        screen_surface.draw.text(f"Life: {self.player.life}", (50, 50), color="white", fontsize=30)
-        screen_surface.draw.text(f"Dash: {self.player.n_dash}", (50, 90), color="white", fontsize=30)
+    def create_particles(self, x, y):
+        self.particles.emit(x, y, 10)
+
+    def coins_remaining(self):
+        return self.coin_total - len(self.collected_coins)
+
+    def load_chunk(self, index, columns):
+        return run_steps(self.chunk_steps(index, columns))
+
+    def chunk_steps(self, index, columns):
+        chunk = LevelChunk(index)
+        yield from self.map_steps(chunk.sprites, chunk.collisions, None, index * columns, (index + 1) * columns)
+        self.all_collisions.extend(chunk.collisions)
+        for start in range(0, len(chunk.collisions), PRELOAD_BATCH):
+            for sprite in chunk.collisions[start:start + PRELOAD_BATCH]:
+                self.grid.insert(sprite)
+                sprite.grids.append(self.grid)
+                if sprite.name in self.trigger_handlers: self.triggers.add(sprite)
+            yield
+        for start in range(0, len(chunk.sprites), PRELOAD_BATCH):
+            batch = chunk.sprites[start:start + PRELOAD_BATCH]
+            self.all_sprites.extend(batch)
+            for sprite in batch:
+                if isinstance(sprite, (Bee, Coin)):
+                    self.sprite_grid.insert(sprite)
+                    sprite.grids.append(self.sprite_grid)
+            self.static_layer.add([sprite for sprite in batch if type(sprite) is Obj])
+            yield
+        return chunk
+
+    def release_chunk(self, chunk):
+        released = set()
+        for sprite in chunk.sprites + chunk.collisions:
+            self.triggers.remove(sprite)
+            if isinstance(sprite, (Bee, Coin)): sprite.store.release(sprite)
+            for grid in sprite.grids: grid.remove(sprite)
+            sprite.grids = []
+            released.add(id(sprite))
+        for sprite in chunk.sprites: self.all_sprites.remove(sprite)
+        self.all_collisions[:] = [sprite for sprite in self.all_collisions if id(sprite) not in released]
+        self.static_layer.remove([sprite for sprite in chunk.sprites if type(sprite) is Obj], chunk.index)
+
+    def draw(self, screen_surface, alpha=1.0):
+        self.camera.resize(screen_surface.surface.get_size())
+        offset = self.camera.interpolate(alpha)
+        with profiler.section('static'):
+            self.static_layer.draw(screen_surface, offset)
+        with profiler.section('actors'):
+            self.player.draw(offset, alpha)
+            blit_sprites(screen_surface.surface, self.sprite_grid.query(self.camera.viewport(TILE_SIZE)), offset, alpha)
+        with profiler.section('fade'):
+            self.fade.draw()
+        with profiler.section('particles_draw'):
+            self.particles.draw(screen_surface, offset)
+        with profiler.section('hud'):
+            self.draw_hud(screen_surface)
+
+    def refresh_hud(self):
+        state = (self.player.life, self.player.n_dash)
+        if state != self.hud_state:
+            self.hud_state = state
+            self.hud = [text_cache.render(f"Life: {state[0]}", (50, 50), color="white", fontsize=30),
+                        text_cache.render(f"Dash: {state[1]}", (50, 90), color="white", fontsize=30)]
+
+    def draw_hud(self, screen_surface):
+        self.refresh_hud()
+        for surface, position in self.hud:
+            screen_surface.surface.blit(surface, position)
+
+    def dirty_items(self, alpha=1.0):
+        if self.fade.alpha > 0:
+            return None
+        offset = self.camera.interpolate(alpha)
+        # any scroll moves the whole picture, so the camera is one screen-sized item keyed on its offset
+        items = [('camera', (0, 0, self.camera.width, self.camera.height), offset)]
+        player = self.player
+        dx, dy = player.interpolation(alpha)
+        x, y = player.x + dx - offset[0], player.y + dy - offset[1]
+        base_width, base_height = player.base_surface.get_size()
+        overlay_width, overlay_height = player.overlay_surface.get_size()
+        items.append(('player', (x - 30, y - 20, max(base_width + 10, overlay_width), max(base_height, overlay_height)),
+                      player.overlay_surface))
+        for sprite in self.sprite_grid.query(self.camera.viewport(TILE_SIZE)):
+            dx, dy = sprite.interpolation(alpha)
+            items.append((id(sprite), (sprite.left + dx - offset[0], sprite.top + dy - offset[1]) + sprite._surf.get_size(), sprite._surf))
+        bounds = self.particles.bounds()
+        if bounds is not None:
+            left, top, width, height = bounds
+            items.append(('particles', (left - offset[0], top - offset[1], width, height), self.particles.version))
+        self.refresh_hud()
+        items.extend((('hud', index), position + surface.get_size(), surface) for index, (surface, position) in enumerate(self.hud))
+        return items
+
+    def counts(self):
+        return {'sprites': len(self.all_sprites), 'collisions': len(self.all_collisions),
+                'bees': len(self.bees), 'coins': len(self.coins),
+                'particles': len(self.particles), 'chunks': len(self.chunks.live)}
 
     def check_collision(self):
-        global n_stage
-        player_collided_with_obstacle_this_frame = False
-
-        for sprite in list(self.all_collisions): 
-            if self.player.colliderect(sprite): 
-                if sprite.name == "next":
-                    n_stage += 1
-                    if n_stage >= len(self.world_map):
-                        self.change_scene(GameOver(won=True))
-                    else:
-                        self.change_scene(GameScene())
-                    return 
-                elif sprite.name == "obstacle" and not player_collided_with_obstacle_this_frame:
-                    player_collided_with_obstacle_this_frame = True 
-                    if self.player.life > 1:
-                        self.player.life -= 1
-                        if sound_enabled: sounds.death.play() # type: ignore
-                        self.create_particles(self.player.x, self.player.y)
-                        self.player.return_to_start()
-                    else: 
-                        self.player.life = 0 
-                        self.change_scene(GameOver(won=False))
-                    return 
-                elif sprite.name == "theend":
-                    self.change_scene(GameOver(won=True))
-                    return 
-                elif sprite.name == "coin":
-                    if sprite in self.all_collisions: self.all_collisions.remove(sprite)
-                    if sprite in self.all_sprites: self.all_sprites.remove(sprite)
-                    if sound_enabled: sounds.coin.play() # type: ignore
+        # triggers come back in load order; the first handler that returns True ends the frame
+        for sprite in self.triggers.hits(self.player):
+            if self.trigger_handlers[sprite.name](sprite): return
+
+    def on_next(self, sprite):
+        self.world.stage += 1
+        if self.world.stage >= len(self.world_map):
+            self.change_scene(GameOver(self.world, won=True))
+        else:
+            self.change_scene(self.world.preloader.take(self.world.stage) or GameScene(self.world))
+        return True
+
+    def on_obstacle(self, sprite):
+        if self.player.life > 1:
+            self.player.life -= 1
+            audio.play('death')
+            self.create_particles(self.player.x, self.player.y)
+            self.player.return_to_start()
+        else: 
+            self.player.life = 0 
+            self.change_scene(GameOver(self.world, won=False))
+        return True
+
+    def on_theend(self, sprite):
+        self.change_scene(GameOver(self.world, won=True))
+        return True
+
+    def on_coin(self, sprite):
+        # tombstone: the coin leaves every index and all_sprites now, all_collisions when its chunk is released
+        sprite.collected = True
+        sprite.store.release(sprite)
+        self.all_sprites.remove(sprite)
+        self.triggers.remove(sprite)
+        for grid in sprite.grids: grid.remove(sprite)
+        sprite.grids = []
+        self.collected_coins.add(sprite.tile)
+        audio.play('coin')
+        return False
 
     def update(self):
-        for sprite in self.all_sprites: sprite.update() 
-        for particle in list(self.particles): 
-            particle.update()
-            if particle.life <= 0: self.particles.remove(particle)
-        self.check_collision()
+        self.world.preloader.request(self.world.stage + 1)
+        self.player.snapshot()
+        self.camera.snapshot()
+        nearby = self.sprite_grid.query(self.camera.viewport(UPDATE_MARGIN))
+        for sprite in nearby: sprite.snapshot()
+        with profiler.section('player'):
+            self.player.update()
+        with profiler.section('sprites'):
+            self.bees.update(nearby)
+            self.coins.update(nearby)
+        self.fade.update()
+        with profiler.section('particles'):
+            self.particles.update()
+        with profiler.section('triggers'):
+            self.check_collision()
+        self.camera.follow(self.player)
+        with profiler.section('chunks'):
+            self.chunks.update(self.camera)
         
 class GameOver(Scene):
-    def __init__(self, won=False): 
-        super().__init__()
-        self.all_sprites = [] 
+    def __init__(self, world, won=False): 
+        super().__init__(world)
         self.won = won
         self.button = Button('menu/text_play', (WIDTH /2 - 57, HEIGHT - 200), self.all_sprites) 
         self.fade = Fade(self.all_sprites)
         self.fade.fadein()
         if self.won:
-            self.start_music(music, 'win') # type: ignore
+            audio.play_music('win')
             self.game_over_message = "As nevoas se dissipam. O guerreiro triunfou, e a floresta agora sussurra seu nome entre as folhas. VITORIA!"
         else:
-            self.start_music(music, 'gameover') # type: ignore
+            audio.play_music('gameover')
             self.game_over_message = GAMEOVER_TEXT
-        global n_stage
-        n_stage = 0 
+        self.world.stage = 0 
             
     def on_key_down(self, key):
         if key == keys.ESCAPE: quit() # type: ignore
-        if key == keys.RETURN: self.change_scene(MenuScene()) # type: ignore
+        if key == keys.RETURN: self.change_scene(MenuScene(self.world)) # type: ignore
 
     def on_mouse_down(self, pos):
-        if self.button.collidepoint(pos): self.change_scene(MenuScene())
+        if self.button.collidepoint(pos): self.change_scene(MenuScene(self.world))
 
-    def draw(self, screen_surface):
+    def draw(self, screen_surface, alpha=1.0):
         screen_surface.fill(COLOR_BG)
-        screen_surface.draw.text(self.game_over_message, 
-                                 (WIDTH/2, 150), 
-                                 centerx=WIDTH/2, 
-                                 fontsize=30, 
-                                 color="white", 
-                                 width=WIDTH-200, 
-                                 align="center", 
-                                 lineheight=1.2)
-        for sprite in self.all_sprites: sprite.draw()
+        text_cache.draw(screen_surface, self.game_over_message, 
+                        (WIDTH/2, 150), 
+                        centerx=WIDTH/2, 
+                        fontsize=30, 
+                        color="white", 
+                        width=WIDTH-200, 
+                        align="center", 
+                        lineheight=1.2)
+        self.all_sprites.draw(screen_surface.surface)
+
+    def dirty_items(self, alpha=1.0):
+        return self.sprite_items(self.all_sprites)
 
     def update(self):
-        for sprite in self.all_sprites: sprite.update()
+        self.all_sprites.update()
+
+class World:
+    # everything one run of the game owns; the window drives one, headless tools can run many side by side
+    def __init__(self, world_map=None, seed=None, player_params=None, bee_params=None):
+        self.world_map = world_map if world_map is not None else WORLD_MAP
+        self.random = random.Random(seed)
+        self.player_params = dict(player_params or {})
+        self.bee_params = dict(bee_params or {})
+        self.stage = 0
+        self.scene = None
+        self.preloader = StagePreloader(self)
+        self.replay_session = None
+
+    def start(self, scene=None):
+        self.scene = scene or MenuScene(self)
+        return self.scene
+
+    def tick(self):
+        session = self.replay_session
+        if session: session.before_tick(self.scene)
+        self.scene.update()
+        if session: session.after_tick(self.scene)
+        if self.scene.new != self.scene: 
+            self.scene = self.scene.new
+        if session and (session.finished or not isinstance(self.scene, GameScene)):
+            self.stop_replay()
+
+    def start_replay(self, playback):
+        if playback:
+            if not os.path.exists(REPLAY_PATH): return
+            replay = Replay.load(REPLAY_PATH)
+        else:
+            replay = Replay(self.stage, self.random.getrandbits(32))
+        self.replay_session = ReplaySession(replay, playback, REPLAY_PATH)
+        self.scene = self.replay_session.start(self)
+
+    def stop_replay(self):
+        session, self.replay_session = self.replay_session, None
+        # a session without a path belongs to a headless caller, which saves and reports it itself
+        if session.path is None: return
+        if session.playback:
+            if isinstance(self.scene, GameScene): self.scene.player.controls = keyboard # type: ignore
+            if session.desync is None: print(f"replay ok: {session.frame} frames")
+        else:
+            session.replay.save(session.path)
+            print(f"recorded {len(session.replay)} frames to {session.path}")
 
-current_scene = MenuScene()
+assets.warm_up()
+audio.load()
+world = World()
+world.start()
+renderer = DirtyRenderer()
+transitions = TransitionCompositor()
 
-def draw(): 
-    current_scene.draw(screen) # type: ignore
+loop = FixedStepLoop(world.tick)
 
-def update():
-    global current_scene
-    current_scene.update()
-    if current_scene.new != current_scene: 
-        current_scene = current_scene.new
+def draw(): 
+    with profiler.section('draw'):
+        if transitions.draw(world.scene, screen, loop.alpha): renderer.invalidate() # type: ignore
+        else: renderer.draw(world.scene, screen, loop.alpha, full=profiler.visible) # type: ignore
+    profiler.draw(screen, world.scene.counts()) # type: ignore
+    profiler.end_frame()
+
+def update(dt):
+    profiler.begin_frame()
+    with profiler.section('update'):
+        # the world holds still under a cross-fade so the incoming snapshot stays true
+        if transitions.active: transitions.advance(dt)
+        else: loop.advance(dt)
+    with profiler.section('preload'):
+        world.preloader.idle()
+    audio.update()
 
 def on_mouse_down(pos): 
-    current_scene.on_mouse_down(pos) 
+    world.scene.on_mouse_down(pos) 
 
 def on_key_down(key): 
-    current_scene.on_key_down(key)      
+    if key == keys.F3: profiler.visible = not profiler.visible # type: ignore
+    elif key == keys.F4: # type: ignore
+        profiler.dump_csv('profile.csv')
+        profiler.dump_trace('profile.json')
+    elif key == keys.F5: # type: ignore
+        if world.replay_session: world.stop_replay()
+        else: world.start_replay(playback=False)
+        return
+    elif key == keys.F6: # type: ignore
+        if world.replay_session: world.stop_replay()
+        world.start_replay(playback=True)
+        return
+    elif key == keys.F7: # type: ignore
+        renderer.set_enabled(not renderer.enabled)
+        return
+    world.scene.on_key_down(key)      
 
 pgzrun.go()
\ No newline at end of file
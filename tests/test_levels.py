@@ -0,0 +1,14 @@
+import os
+
+import pytest
+
+import headless
+
+main = headless.boot()
+
+@pytest.mark.parametrize('stage', range(len(main.BUILTIN_MAPS)))
+def test_compiled_stage_matches_its_text_map(stage):
+    path = os.path.join(main.LEVEL_DIR, f'stage{stage}.lvl')
+    with open(path, 'rb') as level_file:
+        compiled = level_file.read()
+    assert compiled == main.compile_level(main.BUILTIN_MAPS[stage]), f'{path} is out of date with MAP{stage}, run python levelc.py'
@@ -0,0 +1,40 @@
+import math
+
+import bench
+import headless
+
+def test_each_preload_step_does_one_bounded_piece_of_work(monkeypatch):
+    # one tile row of sprites, one PRELOAD_BATCH of sprites filed in the grids, or one page band per step;
+    # wall-clock time per step is machine-dependent and lives in bench.py instead
+    main = headless.boot()
+    level = bench.generate_level(200, 40, **bench.DENSITIES['dense'])
+    step = {'created': 0, 'filed': set(), 'queried': []}
+    create, insert, query = main.GameObject.__init__, main.SpatialGrid.insert, main.SpatialGrid.query
+
+    def counting_create(self, *args, **kwargs):
+        step['created'] += 1
+        create(self, *args, **kwargs)
+
+    def counting_insert(self, obj):
+        step['filed'].add(id(obj))
+        insert(self, obj)
+
+    def counting_query(self, rect, margin=0):
+        step['queried'].append(rect.height + 2 * margin)
+        return query(self, rect, margin)
+
+    monkeypatch.setattr(main.GameObject, '__init__', counting_create)
+    monkeypatch.setattr(main.SpatialGrid, 'insert', counting_insert)
+    monkeypatch.setattr(main.SpatialGrid, 'query', counting_query)
+    scene = main.GameScene(main.World(), level, preload=True)
+    tile_row = max(main.CHUNK_COLUMNS, math.ceil(main.WIDTH / main.TILE_SIZE))
+    steps = 0
+    while scene.loading is not None:
+        step['created'], step['filed'], step['queried'] = 0, set(), []
+        scene.load_step()
+        steps += 1
+        assert step['created'] <= tile_row
+        assert len(step['filed']) <= main.PRELOAD_BATCH
+        assert len(step['queried']) <= 1
+        assert all(height <= main.PAGE_BAND_ROWS * main.TILE_SIZE for height in step['queried'])
+    assert steps > len(level)
@@ -0,0 +1,39 @@
+import os
+import types
+
+import pytest
+from pgzero import runner
+
+import headless
+
+@pytest.fixture(scope='module')
+def game():
+    # load main.py the way pgzrun does: prepare_mod swaps in pgzero's builtins (its __file__ too), then exec
+    headless.boot()
+    path = os.path.join(os.path.dirname(os.path.abspath(headless.__file__)), 'main.py')
+    with open(path) as source:
+        code = compile(source.read(), os.path.basename(path), 'exec', dont_inherit=True)
+    module = types.ModuleType('main')
+    module.__file__ = path
+    runner.prepare_mod(module)
+    exec(code, module.__dict__)
+    return module
+
+def test_asset_folders_resolve_under_the_runner(game):
+    game_dir = os.path.dirname(os.path.abspath(headless.__file__))
+    assert game.GAME_DIR == game_dir
+    for path in (game.SOUND_DIR, game.MUSIC_DIR):
+        assert os.path.isdir(path), path
+
+def test_warm_up_finds_the_images_under_the_runner(game):
+    assert os.path.isdir(game.IMAGE_DIR)
+    assert 'player/idle/0' in game.assets.surfaces
+
+def test_animation_frames_come_from_the_atlas_under_the_runner(game):
+    assert os.path.isfile(game.ATLAS_INDEX)
+    assert set(game.assets.sheets) == {'bee', 'coin', 'player'}
+    assert game.assets.surfaces['player/idle/0'].get_parent() is game.assets.sheets['player']
+
+def test_stages_load_from_the_level_files_under_the_runner(game):
+    assert os.path.isdir(game.LEVEL_DIR)
+    assert all(isinstance(stage, game.Level) for stage in game.WORLD_MAP)